@@ -0,0 +1,118 @@
+# info dicts for the offline benchmarks.
+#
+# recorded ones (python -m benchmarks.record <url> <name>) are read from benchmarks/fixtures/
+# when they exist, otherwise synthetic ones with the same shape as yt-dlp's output are built
+# from a fixed seed, so every run measures the same data.
+
+import json
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+WORDS = (
+    "minji", "newjeans", "ditto", "hype", "boy", "attention", "cookie", "omg", "super", "shy",
+    "official", "mv", "live", "lyrics", "remix", "ver.", "[4k]", "*special*", "&amp;", "&quot;",
+    "cover", "dance_practice", "{audio}", "  ", "한국어", "日本語", "feat.", "(sped up)",
+)
+
+CHANNELS = [f"channel {n}" for n in range(200)]
+
+
+def load(name):
+    path = os.path.join(FIXTURES_DIR, f"{name}.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def title(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+
+
+def video_id(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_") for _ in range(11))
+
+
+def formats(rng, vid):
+
+    base = f"https://rr1---sn-example.googlevideo.com/videoplayback?id={vid}&expire=1900000000"
+
+    result = [{'format_id': 'sb0', 'url': base + "&sb", 'ext': 'mhtml', 'acodec': 'none', 'vcodec': 'none'}]
+
+    for format_id, ext, acodec, abr in (
+        ('139', 'm4a', 'mp4a.40.5', 48), ('249', 'webm', 'opus', 50), ('250', 'webm', 'opus', 70),
+        ('140', 'm4a', 'mp4a.40.2', 128), ('251', 'webm', 'opus', 160),
+    ):
+        result.append({
+            'format_id': format_id, 'url': f"{base}&itag={format_id}", 'ext': ext, 'acodec': acodec,
+            'vcodec': 'none', 'abr': abr, 'asr': 48000, 'filesize': rng.randint(10**6, 10**7),
+        })
+
+    for format_id in ('160', '278', '133', '242', '134', '243', '135', '244', '136', '247', '137', '248', '18'):
+        result.append({
+            'format_id': format_id, 'url': f"{base}&itag={format_id}", 'ext': 'mp4' if format_id < '200' else 'webm',
+            'acodec': 'mp4a.40.2' if format_id == '18' else 'none', 'vcodec': 'avc1', 'filesize': rng.randint(10**6, 10**8),
+        })
+
+    rng.shuffle(result)
+
+    return result
+
+
+def entry(rng):
+    vid = video_id(rng)
+    return {
+        'id': vid,
+        'title': title(rng),
+        'uploader': rng.choice(CHANNELS),
+        'duration': rng.randint(0, 600) or None,  # lives and removed videos come without one
+        'url': vid,
+        'thumbnail': None,
+    }
+
+
+def video_info(seed=0):
+
+    if (info := load("video")):
+        return info
+
+    rng = random.Random(seed)
+    vid = video_id(rng)
+
+    return {
+        'id': vid,
+        'title': title(rng),
+        'uploader': rng.choice(CHANNELS),
+        'duration': 213,
+        'webpage_url': f"https://www.youtube.com/watch?v={vid}",
+        'thumbnail': f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg",
+        'extractor_key': 'Youtube',
+        'formats': formats(rng, vid),
+    }
+
+
+def search_info(seed=1):
+
+    if (info := load("search")):
+        return info
+
+    rng = random.Random(seed)
+
+    return {'extractor_key': 'YoutubeSearch', 'entries': [entry(rng) for _ in range(5)]}
+
+
+def playlist_info(size=5000, seed=2):
+
+    if (info := load("playlist")):
+        return info
+
+    rng = random.Random(seed)
+
+    return {'extractor_key': 'YoutubeTab', 'title': title(rng), 'entries': [entry(rng) for _ in range(size)]}
+
+
+def titles(count=100000, seed=3):
+    rng = random.Random(seed)
+    return [title(rng) for _ in range(count)]
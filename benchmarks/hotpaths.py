@@ -0,0 +1,272 @@
+# offline micro-benchmarks of the music cog hot paths, no network and no voice connection.
+#
+#   python -m benchmarks.hotpaths [search|fix_characters|queue|queue_embed|select_format|frames...] [--output results.json]
+#
+# every row is printed as a json line; --output also writes them to a file together with
+# the python version and git commit, to compare runs over time.
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# the cog opens its sqlite store on import
+os.environ.setdefault("CACHE_DB", ":memory:")
+
+from benchmarks import fixtures
+from utils.cache import ExtractCache
+from utils.queue import Track, TrackQueue
+from cogs.music import YTDLSource, build_tracks, fix_characters, QueuePages, select_format
+
+FRAME_SIZE = 3840  # 20ms of 48khz 16bit stereo
+OPUS_FRAME_SIZE = 160
+
+
+class StubSource:
+
+    def __init__(self, frames, size=FRAME_SIZE, opus=False):
+        self.frame = os.urandom(size)
+        self.left = frames
+        self.opus = opus
+
+    def read(self):
+        if not self.left:
+            return b""
+        self.left -= 1
+        return self.frame
+
+    def is_opus(self):
+        return self.opus
+
+    def cleanup(self):
+        pass
+
+
+class StubVoiceClient:
+
+    # what disnake's AudioPlayer does for every 20ms frame, minus the sleeping and sending
+
+    def __init__(self):
+        self.sent = 0
+
+    def play(self, source):
+        while (data := source.read()):
+            if not source.is_opus():
+                # the encoder call is replaced by a length check
+                len(data)
+            self.sent += 1
+
+
+def measure(name, func, ops, repeat=5):
+
+    times = []
+
+    for _ in range(repeat):
+        setup = func()
+        start = time.perf_counter()
+        setup()
+        times.append(time.perf_counter() - start)
+
+    best, median = min(times), statistics.median(times)
+
+    return {
+        'name': name,
+        'ops': ops,
+        'median_s': median,
+        'best_s': best,
+        'per_op_us': median / ops * 1e6,
+        'ops_per_s': ops / median,
+    }
+
+
+def bench_search():
+
+    search, playlist = fixtures.search_info(), fixtures.playlist_info()
+    cache = ExtractCache()
+
+    def search_post():
+        def run():
+            for n in range(2000):
+                tracks = build_tracks(search['entries'][:1])
+                cache.set_search(f"ytsearch:query {n}", tracks)
+                [Track.from_dict(t, 1) for t in tracks]
+        return run
+
+    def playlist_post():
+        def run():
+            TrackQueue(Track.from_dict(t, 1) for t in build_tracks(playlist['entries']))
+        return run
+
+    yield measure("search.post_process", search_post, 2000)
+    yield measure("search.playlist_post_process", playlist_post, len(playlist['entries']))
+
+
+def bench_fix_characters():
+
+    titles = fixtures.titles()
+
+    def run():
+        return lambda: [fix_characters(t) for t in titles]
+
+    yield measure("fix_characters", run, len(titles))
+
+
+def bench_queue(size=10000):
+
+    tracks = [Track.from_dict(t, 1) for t in build_tracks(fixtures.playlist_info(size * 2)['entries'])][:size]
+
+    def filled():
+        return TrackQueue(tracks)
+
+    def extend():
+        return lambda: TrackQueue(tracks)
+
+    def popleft():
+        queue = filled()
+        def run():
+            while queue:
+                queue.popleft()
+        return run
+
+    def append():
+        queue = TrackQueue()
+        def run():
+            for t in tracks:
+                queue.append(t)
+        return run
+
+    def shuffle():
+        queue = filled()
+        return lambda: [queue.shuffle() for _ in range(10)]
+
+    def remove_middle():
+        queue = filled()
+        middle = tracks[size // 2:size // 2 + 100]
+        def run():
+            for t in middle:
+                queue.remove(t)
+        return run
+
+    def page():
+        queue = filled()
+        return lambda: [queue[n:n + 20] for n in range(0, size, 20)]
+
+    yield measure("queue.extend_10k", extend, size)
+    yield measure("queue.append_10k", append, size)
+    yield measure("queue.popleft_10k", popleft, size)
+    yield measure("queue.shuffle_10k", shuffle, 10)
+    yield measure("queue.remove_middle_10k", remove_middle, 100)
+    yield measure("queue.slice_pages_10k", page, size // 20)
+
+
+def bench_queue_embed(size=10000):
+
+    queue = TrackQueue(Track.from_dict(t, 1) for t in build_tracks(fixtures.playlist_info(size * 2)['entries']))
+
+    def render(page):
+        # a page rendered after every change of the queue
+        def run():
+            pages = QueuePages(queue)
+            pages.refresh()
+            def go():
+                for _ in range(1000):
+                    pages.pages.clear()
+                    pages.render(page)
+            return go
+        return run
+
+    def changed():
+        # the queue changed since the last view: the copy of the tracks is paid again
+        def run():
+            pages = QueuePages(queue)
+            def go():
+                for _ in range(100):
+                    pages.version = None
+                    pages.render(0)
+            return go
+        return run
+
+    def cached():
+        pages = QueuePages(queue)
+        return lambda: [pages.render(199) for _ in range(1000)]
+
+    yield measure("queue_embed.page_1_10k", render(0), 1000)
+    yield measure("queue_embed.page_200_10k", render(199), 1000)
+    yield measure("queue_embed.changed_10k", changed(), 100)
+    yield measure("queue_embed.cached_10k", cached, 1000)
+
+
+def bench_select_format():
+
+    formats = fixtures.video_info()['formats']
+
+    def opus():
+        return lambda: [select_format(formats, opus=True) for _ in range(10000)]
+
+    def pcm():
+        return lambda: [select_format(formats, opus=False) for _ in range(10000)]
+
+    yield measure("select_format.opus", opus, 10000)
+    yield measure("select_format.pcm", pcm, 10000)
+
+
+def bench_frames(seconds=300):
+
+    frames = seconds * 50
+
+    def play(size=FRAME_SIZE, opus=False, volume=None):
+        def setup():
+            source = YTDLSource(StubSource(frames, size, opus))
+            if volume:
+                source.set_volume(volume)
+            return lambda: StubVoiceClient().play(source)
+        return setup
+
+    yield measure("frames.opus_passthrough", play(OPUS_FRAME_SIZE, opus=True), frames)
+    yield measure("frames.pcm", play(), frames)
+    yield measure("frames.pcm_live_volume", play(volume=50), frames)
+
+
+BENCHMARKS = (bench_search, bench_fix_characters, bench_queue, bench_queue_embed, bench_select_format, bench_frames)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(args):
+
+    output = None
+
+    if "--output" in args:
+        index = args.index("--output")
+        output = args[index + 1]
+        args = args[:index] + args[index + 2:]
+
+    rows = []
+
+    for bench in BENCHMARKS:
+        if args and bench.__name__[len("bench_"):] not in args:
+            continue
+        for row in bench():
+            print(json.dumps(row))
+            rows.append(row)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({
+                'python': platform.python_version(),
+                'commit': git_commit(),
+                'time': time.time(),
+                'results': rows,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
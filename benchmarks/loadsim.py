@@ -0,0 +1,360 @@
+# how many guilds one process can keep playing before audio degrades.
+#
+#   python -m benchmarks.loadsim [--steps 100,250,500,1000,2000] [--window 20] [--ramp 10]
+#                                [--latency lognormal:0.8:0.6] [--songs 500] [--track-seconds 30]
+#
+# runs the real music cog with fake interactions and voice clients. every voice client has
+# its own thread sending a frame every 20ms like disnake's AudioPlayer, and counts the frames
+# that were ready after their deadline. extraction is replaced by a stand-in that sleeps for
+# a duration drawn from --latency (fixed:S, uniform:A:B or lognormal:MEDIAN:SIGMA) and
+# ffmpeg by a source handing out prepared opus frames, so the cost of those two processes
+# is not part of the numbers (see benchmarks.volume for ffmpeg).
+#
+# guilds are added step by step; after each step one json line reports deadline misses,
+# memory per player and cpu per stream. EXTRACT_WORKERS / EXTRACT_QUEUE_MAX apply as usual.
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+os.environ.setdefault("CACHE_DB", ":memory:")
+os.environ.setdefault("EXTRACT_MODE", "thread")
+
+import disnake
+
+from benchmarks import fixtures
+import cogs.music as music_module
+
+OPUS_FRAME = os.urandom(160)
+
+
+def latency_sampler(spec):
+
+    kind, *args = spec.split(":")
+    args = [float(a) for a in args]
+    rng = random.Random(0)
+
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(args[0], args[1])
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(args[0]), args[1])
+
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+class FakeExtractor:
+
+    # stands in for utils.extractor.extract, runs on the scheduler's threads
+
+    def __init__(self, latency, songs, track_seconds):
+        self.latency = latency
+        self.track_seconds = track_seconds
+        self.songs = [fixtures.video_id(random.Random(n)) for n in range(songs)]
+        self.calls = 0
+
+    def __call__(self, url):
+
+        self.calls += 1
+        time.sleep(self.latency())
+
+        if url.startswith("ytsearch:"):
+            vid = self.songs[zlib.crc32(url.encode()) % len(self.songs)]
+            return {
+                'extractor_key': 'YoutubeSearch',
+                'entries': [{'id': vid, 'url': vid, 'title': f"song {vid}", 'uploader': "sim", 'duration': self.track_seconds}],
+            }
+
+        vid = url.rsplit("=", 1)[-1]
+        info = fixtures.video_info()
+
+        return dict(
+            info,
+            id=vid,
+            title=f"song {vid}",
+            duration=self.track_seconds,
+            webpage_url=url,
+            formats=[dict(f, url=f"{f['url']}&dur={self.track_seconds}") for f in info['formats']],
+        )
+
+
+class FakeStream(disnake.AudioSource):
+
+    # FFmpegOpusAudio / FFmpegPCMAudio without the process: the frames of `dur` seconds
+
+    def __init__(self, url, **kwargs):
+        self.left = int(url.rsplit("dur=", 1)[-1]) * 50
+
+    def read(self):
+        if self.left <= 0:
+            return b""
+        self.left -= 1
+        return OPUS_FRAME
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self.left = 0
+
+
+class FakeVoiceClient:
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.source = None
+        self.thread = None
+        self.stopped = False
+        self.frames = 0
+        self.late = 0
+        self.worst = 0.0
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return bool(self.thread and self.thread.is_alive() and not self.stopped)
+
+    def play(self, source, after=None):
+        self.source = source
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, args=(source, after), daemon=True)
+        self.thread.start()
+
+    def run(self, source, after):
+
+        next_time = time.perf_counter()
+
+        while not self.stopped:
+
+            if not (data := source.read()):
+                break
+
+            source.is_opus()
+            self.frames += 1
+            next_time += 0.02
+
+            if (delay := next_time - time.perf_counter()) < 0:
+                # the frame for this slot wasn't ready in time: an audible stutter
+                self.late += 1
+                self.worst = max(self.worst, -delay)
+                next_time = time.perf_counter()
+            else:
+                time.sleep(delay)
+
+        source.cleanup()
+
+        if after:
+            after(None)
+
+    def stop(self):
+        self.stopped = True
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, force=False):
+        self.stop()
+
+    def cleanup(self):
+        self.stop()
+
+
+class FakeChannel:
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.members = []
+
+    async def connect(self, **kwargs):
+        self.guild.voice_client = FakeVoiceClient(self)
+        self.guild.me.voice = SimpleNamespace(channel=self)
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        return SimpleNamespace(delete=self.noop, edit=self.noop)
+
+    async def noop(self, *args, **kwargs):
+        pass
+
+
+class FakeResponse:
+
+    async def defer(self, **kwargs):
+        pass
+
+
+def fake_interaction(bot, cog, guild_id):
+
+    guild = SimpleNamespace(id=guild_id, voice_client=None, me=SimpleNamespace(voice=None))
+    channel = FakeChannel(guild)
+
+    async def send(*args, **kwargs):
+        pass
+
+    return SimpleNamespace(
+        bot=bot,
+        cog=cog,
+        guild=guild,
+        me=guild.me,
+        channel=channel,
+        author=SimpleNamespace(id=guild_id, voice=SimpleNamespace(channel=channel), guild_permissions=SimpleNamespace(manage_channels=True)),
+        response=FakeResponse(),
+        application_command=SimpleNamespace(qualified_name="music play"),
+        send=send,
+        edit_original_message=send,
+        player=None,
+    )
+
+
+class FakeBot:
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.players = {}
+        self.user = SimpleNamespace(id=0)
+
+    async def wait_until_ready(self):
+        pass
+
+
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def add_guild(bot, cog, guild_id, requests, refused, delay=0.0):
+
+    await asyncio.sleep(delay)
+
+    inter = fake_interaction(bot, cog, guild_id)
+
+    for n in range(requests):
+        await cog.cog_before_slash_command_invoke(inter)
+        try:
+            await cog.p.callback(cog, inter, f"sim song {random.randrange(1 << 30)}")
+        finally:
+            await cog.cog_after_slash_command_invoke(inter)
+
+    if not inter.player:
+        # /music play answered with an error (SchedulerFull...)
+        refused.append(guild_id)
+        return
+
+    # keeps every guild streaming for the whole run
+    inter.player.loop = True
+
+
+def voice_clients(bot):
+    return [p.inter.guild.voice_client for p in list(bot.players.values()) if p.inter.guild.voice_client]
+
+
+async def run(args):
+
+    random.seed(0)
+
+    loop = asyncio.get_running_loop()
+    bot = FakeBot(loop)
+    extractor = FakeExtractor(latency_sampler(args.latency), args.songs, args.track_seconds)
+
+    music_module.extract = extractor
+    disnake.FFmpegOpusAudio = disnake.FFmpegPCMAudio = FakeStream
+
+    cog = music_module.music(bot)
+
+    baseline = rss()
+    guilds = 0
+    refused = []
+
+    for target in args.steps:
+
+        started = time.perf_counter()
+
+        # joins are spread over --ramp seconds, like users arriving
+        await asyncio.gather(*(
+            add_guild(bot, cog, guild_id, args.requests, refused, args.ramp * n / (target - guilds))
+            for n, guild_id in enumerate(range(guilds, target))
+        ))
+
+        ramp = time.perf_counter() - started
+        guilds = target
+
+        await asyncio.sleep(args.settle)
+
+        clients = voice_clients(bot)
+        before = {id(vc): (vc.frames, vc.late) for vc in clients}
+
+        for vc in clients:
+            vc.worst = 0.0
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        await asyncio.sleep(args.window)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+        frames = late = 0
+        worst = 0.0
+
+        for vc in clients:
+            f, l = before.get(id(vc), (0, 0))
+            frames += vc.frames - f
+            late += vc.late - l
+            worst = max(worst, vc.worst)
+
+        streams = sum(1 for vc in clients if vc.is_playing())
+        players = len(bot.players)
+
+        print(json.dumps({
+            'guilds': guilds,
+            'players': players,
+            'streams': streams,
+            'ramp_s': ramp,
+            'frames': frames,
+            'late_frames': late,
+            'late_ratio': late / frames if frames else None,
+            'worst_late_ms': worst * 1000,
+            'expected_frames': int(streams * wall * 50),
+            'cpu_per_stream': cpu / wall / streams if streams else None,
+            'cpu_total': cpu / wall,
+            'rss_mb': rss() / 2**20,
+            'rss_per_player_kb': (rss() - baseline) / players / 1024 if players else None,
+            'loop_lag_ms': cog.loop_lag * 1000,
+            'extractions': extractor.calls,
+            'refused': len(refused),
+            'scheduler': music_module.scheduler.stats(),
+        }), flush=True)
+
+    for vc in voice_clients(bot):
+        vc.stop()
+
+    cog.cog_unload()
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", default="100,250,500,1000,2000", type=lambda s: [int(n) for n in s.split(",")])
+    parser.add_argument("--window", default=20.0, type=float, help="seconds measured per step")
+    parser.add_argument("--ramp", default=10.0, type=float, help="seconds over which each step's guilds join")
+    parser.add_argument("--settle", default=5.0, type=float, help="seconds between adding guilds and measuring")
+    parser.add_argument("--latency", default="lognormal:0.8:0.6")
+    parser.add_argument("--songs", default=500, type=int, help="distinct songs, fewer means more cache hits")
+    parser.add_argument("--requests", default=1, type=int, help="/music play per guild")
+    parser.add_argument("--track-seconds", default=30, type=int)
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
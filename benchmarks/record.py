@@ -0,0 +1,28 @@
+# records a real extraction as a fixture for the offline benchmarks (needs network once)
+#
+#   python -m benchmarks.record https://www.youtube.com/watch?v=... video
+#   python -m benchmarks.record "ytsearch:minji" search
+#   python -m benchmarks.record https://www.youtube.com/playlist?list=... playlist
+
+import json
+import os
+import sys
+
+from benchmarks.fixtures import FIXTURES_DIR
+from utils.extractor import extract
+
+
+def main(url, name):
+
+    info = extract(url)
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json"), "w") as f:
+        json.dump(info, f)
+
+    print(f"{name}: {len(info.get('entries') or info.get('formats') or [])} itens")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
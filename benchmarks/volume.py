@@ -0,0 +1,110 @@
+# CPU cost per stream of the volume handling, with and without the ffmpeg filter graph.
+#
+#   python -m benchmarks.volume [seconds of audio]
+#
+# "python" rows run the frame loop the voice thread runs for each guild (20ms frames):
+#   transformer  - PCMVolumeTransformer, every frame scaled in python (old YTDLSource)
+#   baked        - volume inside ffmpeg, frames passed through untouched (new YTDLSource)
+#   live_change  - new YTDLSource right after /music volume, until the next track
+# "ffmpeg" rows (only when ffmpeg is installed) measure the decoder process itself,
+# with and without the volume filter.
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+import warnings
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    import audioop
+
+FRAME_SIZE = 3840  # 20ms of 48khz 16bit stereo
+
+
+class FakePCM:
+
+    def __init__(self, frames):
+        self.frame = os.urandom(FRAME_SIZE)
+        self.left = frames
+
+    def read(self):
+        if not self.left:
+            return b""
+        self.left -= 1
+        return self.frame
+
+
+def transformer(source, volume):
+    while (data := source.read()):
+        audioop.mul(data, 2, min(volume, 2.0))
+
+
+def baked(source, volume):
+    while source.read():
+        pass
+
+
+def live_change(source, volume):
+    gain = volume / 0.5
+    while (data := source.read()):
+        if gain != 1.0:
+            data = audioop.mul(data, 2, gain)
+
+
+def python_rows(seconds):
+
+    frames = int(seconds * 50)
+    rows = []
+
+    for func in (transformer, baked, live_change):
+        source = FakePCM(frames)
+        start = time.process_time()
+        func(source, 0.8)
+        cpu = time.process_time() - start
+        rows.append({
+            'name': f"python.{func.__name__}",
+            'cpu_per_audio_minute': cpu / seconds * 60,
+            'cpu_per_frame_us': cpu / frames * 1e6,
+        })
+
+    return rows
+
+
+def ffmpeg_rows(seconds):
+
+    if not shutil.which("ffmpeg"):
+        return []
+
+    rows = []
+
+    for name, af in (("ffmpeg.no_filter", None), ("ffmpeg.volume_filter", "volume=0.80")):
+
+        args = ["ffmpeg", "-nostdin", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}"]
+
+        if af:
+            args += ["-af", af]
+
+        args += ["-f", "s16le", "-ar", "48000", "-ac", "2", "-"]
+
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        subprocess.run(args, stdout=subprocess.DEVNULL, check=True)
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        rows.append({'name': name, 'cpu_per_audio_minute': cpu / seconds * 60})
+
+    return rows
+
+
+def main(seconds=600):
+
+    for row in python_rows(seconds) + ffmpeg_rows(seconds):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 600)
@@ -0,0 +1,98 @@
+import io
+import os
+
+import disnake
+from disnake.ext import commands
+
+from utils.watchdog import LoopWatchdog, profile
+
+
+class debug(commands.Cog):
+    def __init__(self, bot):
+
+        self.bot = bot
+        self.profiling = False
+
+        self.watchdog = None
+
+        # WATCHDOG_THRESHOLD_MS=0 turns it off
+        if os.environ.get("WATCHDOG_THRESHOLD_MS") != "0":
+            self.watchdog = bot.watchdog = LoopWatchdog(bot.loop)
+            self.watchdog.start()
+
+    def cog_unload(self):
+        if self.watchdog:
+            self.watchdog.stop()
+
+    async def run_profile(self, seconds, all_threads=False):
+
+        # one at a time, the sampling itself costs cpu
+        if self.profiling:
+            return None
+
+        self.profiling = True
+
+        try:
+            profiler = await profile(seconds, all_threads)
+        finally:
+            self.profiling = False
+
+        path = await self.bot.loop.run_in_executor(None, profiler.save)
+
+        return profiler, path
+
+    @commands.slash_command()
+    @commands.is_owner()
+    async def debug(self, inter: disnake.ApplicationCommandInteraction):
+        pass
+
+    @debug.sub_command(name="profile", description="Grava um perfil do bot para flamegraph (apenas o dono).")
+    async def profile_(
+            self,
+            inter: disnake.ApplicationCommandInteraction,
+            seconds: commands.Range[int, 1, 120] = commands.Param(10, name="segundos"),
+            all_threads: bool = commands.Param(False, name="todas_threads")
+    ):
+
+        await inter.response.defer(ephemeral=True)
+
+        if not (result := await self.run_profile(seconds, all_threads)):
+            await inter.edit_original_message(content="⏳ | Já existe um perfil sendo gravado.")
+            return
+
+        profiler, path = result
+
+        await inter.edit_original_message(
+            content=f"📈 | {profiler.count} amostras em {seconds}s, salvas em `{path}`.",
+            file=disnake.File(io.BytesIO(profiler.folded().encode()), filename=os.path.basename(path))
+        )
+
+    @debug.sub_command(name="watchdog", description="Mostra os bloqueios do event loop (apenas o dono).")
+    async def watchdog_(self, inter: disnake.ApplicationCommandInteraction):
+
+        if not self.watchdog:
+            await inter.send("🚫 | O watchdog está desativado (WATCHDOG_THRESHOLD_MS=0).", ephemeral=True)
+            return
+
+        stats = self.watchdog.stats()
+
+        embed = disnake.Embed(
+            colour=12035816,
+            description=f"**Limite:** `{stats['threshold'] * 1000:.0f}ms`\n"
+                        f"**Bloqueios:** `{stats['stalls']}`\n"
+                        f"**Pior bloqueio:** `{stats['worst'] * 1000:.0f}ms`"
+        )
+
+        await inter.send(embed=embed, ephemeral=True)
+
+    async def cog_slash_command_error(self, inter: disnake.ApplicationCommandInteraction, error: Exception):
+
+        if isinstance(error, commands.NotOwner):
+            await inter.send("🚫 | Apenas o dono do bot pode usar este comando.", ephemeral=True)
+            return
+
+        raise error
+
+
+def setup(client):
+    client.add_cog(debug(client))
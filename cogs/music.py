@@ -1,24 +1,52 @@
 import datetime
 import pprint
 import asyncio
+import os
 import sys
+import threading
+import warnings
+import time
 import traceback
+import contextvars
+import json
+from collections import deque
 from functools import partial
-from random import shuffle
 
 
 import disnake
 from disnake.ext import commands
 
-from yt_dlp import YoutubeDL
 import re
 
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:  # python 3.13+ without audioop-lts
+    audioop = None
+
+from utils.cache import ExtractCache, cache_key, stream_expire, video_id
+from utils.extractor import extract, extract_pages, init_worker, warm_up
+from utils.scheduler import ExtractionScheduler, SchedulerFull, PLAY, SEARCH, PREFETCH, PLAYLIST
+from utils.singleflight import SingleFlight
+from utils.queue import Track, TrackQueue, pack_tracks, unpack_tracks
+from utils.broker import SourceBroker
+from utils.store import ExtractStore
+from utils.audiocache import AudioCache, CacheMiss
+from utils.metrics import registry, child_processes, LAG_BUCKETS, SIZE_BUCKETS
+from utils.tracing import tracer
+from utils.idle import IdleManager
+from utils import message as live_message
+from utils.message import LiveMessage
+from utils import startup
+
 
 URL_REG = re.compile(r'https?://(?:www\.)?.+')
 YOUTUBE_VIDEO_REG = re.compile(r"(https?://)?(www\.)?youtube\.(com|nl)/watch\?v=([-\w]+)")
 
 filters = {
-    'nightcore': 'aresample=48000,asetrate=48000*1.25'
+    'nightcore': 'aresample=48000,asetrate=48000*1.25',
+    'volume': 'volume={volume:.2f}',
 }
 
 
@@ -26,31 +54,16 @@ def utc_time():
     return datetime.datetime.now(datetime.timezone.utc)
 
 
-YDL_OPTIONS = {
-    'noplaylist': True,
-    'nocheckcertificate': True,
-    'ignoreerrors': False,
-    'logtostderr': False,
-    'quiet': True,
-    'no_warnings': True,
-    'retries': 5,
-    'extract_flat': 'in_playlist',
-    'cachedir': False,
-    'extractor_args': {
-        'youtube': {
-            'skip': [
-                'hls',
-                'dash'
-            ],
-            'player_skip': [
-                'js',
-                'configs',
-                'webpage'
-            ]
-        },
-        'youtubetab': ['webpage']
-    }
-}
+# the next track is opened and buffered this long before the current one ends
+PREROLL_SECONDS = float(os.environ.get("PREROLL_SECONDS", 3))
+PREROLL_MAX_BYTES = int(os.environ.get("PREROLL_MAX_KB", 512)) * 1024
+
+# players are saved this often and resumed after a restart, at most RESUME_RATE guilds a second
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", 15))
+RESUME_RATE = float(os.environ.get("RESUME_RATE", 2))
+
+# minimum seconds between two edits of the now playing message of a guild
+NOW_PLAYING_INTERVAL = float(os.environ.get("NOW_PLAYING_INTERVAL", 1.5))
 
 FFMPEG_OPTIONS = {
     'before_options': '-nostdin'
@@ -59,27 +72,154 @@ FFMPEG_OPTIONS = {
 }
 
 
+TITLE_TABLE = str.maketrans({
+    '[': '【',
+    ']': '】',
+    '*': '"',
+    '_': ' ',
+    '{': '\u0028',
+    '}': '\u0029',
+})
+
+TITLE_REPLACES = {
+    '&quot;': '"',
+    '&amp;': '&',
+    '  ': ' ',
+}
+
+TITLE_REG = re.compile("|".join(TITLE_REPLACES))
+
+
 def fix_characters(text: str):
-    replaces = [
-        ('&quot;', '"'),
-        ('&amp;', '&'),
-        ('(', '\u0028'),
-        (')', '\u0029'),
-        ('[', '【'),
-        (']', '】'),
-        ("  ", " "),
-        ("*", '"'),
-        ("_", ' '),
-        ("{", "\u0028"),
-        ("}", "\u0029"),
-    ]
-    for r in replaces:
-        text = text.replace(r[0], r[1])
+
+    text = text.translate(TITLE_TABLE)
+
+    if "&" in text or "  " in text:
+        text = TITLE_REG.sub(lambda m: TITLE_REPLACES[m.group()], text)
 
     return text
 
 
-ytdl = YoutubeDL(YDL_OPTIONS)
+def parse_time(text: str):
+
+    # "1:30", "01:02:03" or "90" -> seconds
+    seconds = 0
+
+    for part in text.strip().split(":"):
+        if not part.isdigit():
+            raise ValueError(f"invalid time: {text}")
+        seconds = seconds * 60 + int(part)
+
+    return seconds
+
+
+def select_format(formats, opus=False):
+
+    # returns (url, is_opus): webm/opus streams can be sent to discord as they are
+    if opus:
+        audio = [f for f in formats if f.get('acodec') == 'opus' and f.get('vcodec') in (None, 'none')]
+        if audio:
+            return max(audio, key=lambda f: f.get('abr') or 0)['url'], True
+
+    for f in formats:
+        if f['ext'] == 'm4a':
+            return f['url'], False
+
+    return formats[0]['url'], False
+
+
+def limit(text, size=30):
+    if len(text) > size:
+        return text[:size - 2] + "..."
+    return text
+
+
+class QueuePages:
+
+    # the queue in pages of `size` tracks. rendered pages are kept until the queue changes
+    # (TrackQueue.version), and the tracks are copied once per version so any page is a
+    # slice instead of a walk from the start of the deque
+
+    def __init__(self, queue, size=10):
+        self.queue = queue
+        self.size = size
+        self.version = None
+        self.tracks = ()
+        self.pages = {}
+
+    def __len__(self):
+        return max(1, -(-len(self.queue) // self.size))
+
+    def refresh(self):
+        if self.version != self.queue.version:
+            self.version = self.queue.version
+            self.tracks = tuple(self.queue)
+            self.pages.clear()
+
+    def render(self, page):
+
+        self.refresh()
+
+        if (text := self.pages.get(page)) is None:
+            start = page * self.size
+            text = self.pages[page] = "".join(
+                f'**{n} | `{datetime.timedelta(seconds=i.duration)}` - ** [{limit(i.title)}]({i.url}) | <@{i.requester_id}>\n'
+                for n, i in enumerate(self.tracks[start:start + self.size], start + 1)
+            )
+
+        return text
+
+
+def build_tracks(entries):
+
+    tracks = []
+
+    for t in entries:
+
+        if not (duration:=t.get('duration')):
+            continue
+
+        url = t.get('webpage_url') or t['url']
+
+        if not URL_REG.match(url):
+            url = f"https://www.youtube.com/watch?v={url}"
+
+        tracks.append(
+            {
+                'url': url,
+                'title': fix_characters(t['title']),
+                'uploader': t.get('uploader'),
+                'duration': duration
+            }
+        )
+
+    return tracks
+
+
+extract_cache = ExtractCache()
+
+scheduler = ExtractionScheduler(initializer=init_worker)
+
+# identical extractions running at the same time (any guild) share a single call
+inflight = SingleFlight()
+
+# searches and video metadata that survive restarts
+store = ExtractStore()
+
+# opus packets of the most played tracks, kept on disk (AUDIO_CACHE_DIR)
+audio_cache = AudioCache() if os.environ.get("AUDIO_CACHE_DIR") else None
+
+# disconnect deadlines of the players left with an empty queue, one timer for all guilds
+idle = IdleManager()
+
+SEARCH_SECONDS = registry.histogram("minji_search_seconds", "search_yt latency, cache hits included")
+RENEW_SECONDS = registry.histogram("minji_renew_url_seconds", "renew_url latency before a track can start")
+FIRST_AUDIO_SECONDS = registry.histogram("minji_first_audio_seconds", "time from /music play to the first audio frame")
+GAP_SECONDS = registry.histogram("minji_track_gap_seconds", "silence between the end of a track and the next one")
+LOOP_LAG_SECONDS = registry.histogram("minji_loop_lag_seconds", "event loop lag", LAG_BUCKETS)
+
+# guilds playing the same track with the same filters share one ffmpeg process
+broker = SourceBroker() if os.environ.get("SHARED_SOURCES") else None
 
 
 def is_requester():
@@ -92,20 +232,210 @@ def is_requester():
         if inter.author.voice and not any(
                 m for m in inter.author.voice.channel.members if not m.bot and m.guild_permissions.manage_channels):
             return True
-        if player.current['requester'] == inter.author:
+        if player.current and player.current.requester_id == inter.author.id:
             return True
 
     return commands.check(predicate)
 
 
-class YTDLSource(disnake.PCMVolumeTransformer):
+class YTDLSource(disnake.AudioSource):
+
+    # wraps the ffmpeg (or shared) source of the current track. frames are counted for the
+    # playback position and only touched after a live volume change, until the next restart
+    # bakes the new volume into the filters (filters['volume'])
+
+    def __init__(self, source, volume=100, offset=0.0, speed=1.0):
+        self.original = source
+        self.baked_volume = volume
+        self.gain = 1.0
+        self.offset = offset
+        self.speed = speed
+        self.frames = 0
+        self.buffer = deque()
+        self.on_first_frame = None
+
+    @property
+    def position(self):
+        return self.offset + self.frames * 0.02 * self.speed
+
+    def set_volume(self, volume):
+        if not audioop or self.original.is_opus():
+            return False
+        gain = volume / self.baked_volume
+        # past 2x the pcm clips, the closest gain plays until the restart bakes the volume
+        self.gain = min(gain, 2.0)
+        return gain <= 2.0
+
+    def preroll(self, seconds=PREROLL_SECONDS, max_bytes=PREROLL_MAX_BYTES):
+        # blocking: fills the buffer with the first frames (ffmpeg start, connect, first bytes)
+        size = 0
+        while len(self.buffer) < seconds * 50 and size < max_bytes:
+            if not (data := self.original.read()):
+                break
+            self.buffer.append(data)
+            size += len(data)
+
+    def read(self):
+        data = self.buffer.popleft() if self.buffer else self.original.read()
+        if data:
+            self.frames += 1
+            if self.gain != 1.0:
+                data = audioop.mul(data, 2, self.gain)
+            if self.on_first_frame and self.frames == 1:
+                self.on_first_frame()
+        return data
 
-    def __init__(self, source):
-        super().__init__(source)
+    def is_opus(self):
+        return self.original.is_opus()
 
-    @classmethod
-    async def source(cls, url, *, ffmpeg_opts):
-        return cls(disnake.FFmpegPCMAudio(url, **ffmpeg_opts))
+    def cleanup(self):
+        self.buffer.clear()
+        self.original.cleanup()
+
+
+class GaplessSource(disnake.AudioSource):
+
+    # the source the voice client plays: when the active track ends it continues with the
+    # pre-rolled pending one on the same frame, without stopping the voice client.
+    # reads block on ffmpeg, so they happen outside the lock: it only guards the swaps of
+    # active/pending, and a frame read from a source swapped out meanwhile is thrown away
+
+    def __init__(self, source, on_switch):
+        self.active = source
+        self.pending = None
+        self.on_switch = on_switch
+        self.lock = threading.Lock()
+
+    def read(self):
+
+        while True:
+
+            source = self.active
+
+            try:
+                data = source.read()
+            except Exception:
+                # closed by whoever replaced it while the read was going on
+                if self.active is source:
+                    raise
+                continue
+
+            with self.lock:
+                if self.active is not source:
+                    continue
+                if data or not self.pending:
+                    return data
+                old, self.active, self.pending = source, self.pending, None
+
+            self.on_switch(old)
+
+    def is_opus(self):
+        return self.active.is_opus()
+
+    def replace(self, source):
+        # a read in progress on the old source is discarded, it can be closed right away
+        with self.lock:
+            old, self.active = self.active, source
+        return old
+
+    def take_pending(self):
+        with self.lock:
+            pending, self.pending = self.pending, None
+        return pending
+
+    def cleanup(self):
+        self.active.cleanup()
+        if (pending := self.take_pending()):
+            pending.cleanup()
+
+
+class ResumedInteraction:
+
+    # stands in for the interaction a player is created with, for the players restored
+    # from a snapshot after a restart
+
+    def __init__(self, bot, cog, guild, channel):
+        self.bot = bot
+        self.cog = cog
+        self.guild = guild
+        self.channel = channel
+        self.player = None
+
+    @property
+    def me(self):
+        return self.guild.me
+
+
+class QueueView(disnake.ui.View):
+
+    def __init__(self, inter, player, timeout=180):
+        super().__init__(timeout=timeout)
+        self.inter = inter
+        self.player = player
+        self.page = 0
+
+    def remaining(self):
+        # the queue keeps its total up to date, only the current track is computed here
+        player = self.player
+        remaining = player.queue.duration
+        if player.current:
+            if player.source:
+                remaining += max(0, player.current.duration - player.source.position) / player.source.speed
+            else:
+                remaining += player.current.duration
+        return int(remaining)
+
+    def embed(self):
+
+        pages = self.player.queue_pages
+        self.page = max(0, min(self.page, len(pages) - 1))
+
+        embed = disnake.Embed(
+            colour=12035816,
+            description=pages.render(self.page) or "🚫 | Não existe músicas na fila no momento."
+        )
+        embed.set_footer(
+            text=f"Página {self.page + 1}/{len(pages)} • {len(self.player.queue)} música(s) • "
+                 f"Duração: {datetime.timedelta(seconds=int(self.player.queue.duration))} • "
+                 f"Restante: {datetime.timedelta(seconds=self.remaining())}"
+        )
+
+        self.first.disabled = self.back.disabled = self.page == 0
+        self.next.disabled = self.last.disabled = self.page >= len(pages) - 1
+
+        return embed
+
+    async def show(self, inter, page):
+        self.page = page
+        await inter.response.edit_message(embed=self.embed(), view=self)
+
+    async def interaction_check(self, inter: disnake.MessageInteraction):
+        if inter.author.id != self.inter.author.id:
+            await inter.send("🚫 | Apenas quem usou o comando pode mudar a página.", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        try:
+            await self.inter.edit_original_message(view=None)
+        except disnake.HTTPException:
+            pass
+
+    @disnake.ui.button(emoji="⏮️", style=disnake.ButtonStyle.secondary)
+    async def first(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        await self.show(inter, 0)
+
+    @disnake.ui.button(emoji="◀️", style=disnake.ButtonStyle.secondary)
+    async def back(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        await self.show(inter, self.page - 1)
+
+    @disnake.ui.button(emoji="▶️", style=disnake.ButtonStyle.secondary)
+    async def next(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        await self.show(inter, self.page + 1)
+
+    @disnake.ui.button(emoji="⏭️", style=disnake.ButtonStyle.secondary)
+    async def last(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        await self.show(inter, len(self.player.queue_pages) - 1)
 
 
 class MusicPlayer:
@@ -113,11 +443,11 @@ class MusicPlayer:
     def __init__(self, inter: commands.Context):
         self.inter = inter
         self.bot = inter.bot
-        self.queue = []
+        self.queue = TrackQueue()
+        self.queue_pages = QueuePages(self.queue)
         self.current = None
         self.event = asyncio.Event()
-        self.now_playing = None
-        self.timeout_task = None
+        self.now_playing = LiveMessage(inter.channel, NOW_PLAYING_INTERVAL)
         self.channel: disnake.VoiceChannel = None
         self.disconnect_timeout = 180
         self.loop = False
@@ -127,11 +457,44 @@ class MusicPlayer:
         self.no_message = False
         self.locked = False
         self.volume = 100
+        self.source = None
+        self.current_info = None
+        self.chain = None
+        self.switched = False
+        self.preroll_task = None
+        self.preroll_track = None
+        self.preroll_info = None
+        self.prefetch_ahead = 1
+        self.prefetching = {}
+        self.gap_started = None
+        self.gaps = deque(maxlen=50)
+        self.requested_at = None
+        self.play_span = None
+        self.resume_at = 0
+        # the task going through the queue, from the first track until the queue is empty
+        self.task = None
+
+    def running(self):
+        return bool(self.task and not self.task.done())
+
+    def start(self):
+        # set before the task gets to run: a playlist page queued right after this one
+        # must not start a second player task
+        if self.running():
+            return False
+        # a clean context: the player task outlives the command that started it and its trace
+        self.task = self.bot.loop.create_task(self.process_next(), context=contextvars.Context())
+        return True
+
+    async def idle_expired(self):
+
+        # the queue may have been filled just before the deadline, or the player replaced.
+        # only the player task counts as activity, not a `current` left behind by an error
+        if self.exiting or self.queue or self.running() or self.bot.players.get(self.inter.guild.id) is not self:
+            return False
 
-    async def player_timeout(self):
-        await asyncio.sleep(self.disconnect_timeout)
         self.exiting = True
-        self.bot.loop.create_task(self.inter.cog.destroy_player(self.inter))
+        await self.inter.cog.destroy_player(self.inter)
 
     async def process_next(self):
 
@@ -143,52 +506,335 @@ class MusicPlayer:
         if self.exiting:
             return
 
-        try:
-            self.timeout_task.cancel()
-        except:
-            pass
+        idle.cancel(self.inter.guild.id)
 
         if not self.queue:
-            self.timeout_task = self.bot.loop.create_task(self.player_timeout())
+            self.gap_started = None
+            idle.schedule(self.inter.guild.id, self.disconnect_timeout, self.idle_expired)
 
             embed = disnake.Embed(
                 description=f"A fila está vazia...\nIrei desligar o player em {self.disconnect_timeout/60} minuto(s) caso não seja adicionada novas músicas.",
                 color=12035816)
-            await self.inter.channel.send(embed=embed)
+            self.now_playing.update(embed=embed)
             return
 
         await self.start_play()
 
     async def renew_url(self):
 
-        info = self.queue.pop(0)
-
-        self.current = info
+        started = time.perf_counter()
 
         try:
-            if info['formats']:
+            with tracer.span("renew_url"):
+                return await self.get_info()
+        finally:
+            RENEW_SECONDS.observe(time.perf_counter() - started)
+
+    async def get_info(self):
+
+        self.current = self.queue.popleft()
+
+        if (info := self.cached_info(self.current)):
+            return info
+
+        url = self.current.url
+
+        if (task := self.prefetching.pop(url, None)) and not task.cancelled():
+            if (info := await task):
                 return info
-        except KeyError:
-            pass
 
-        try:
-            url = info['webpage_url']
-        except KeyError:
-            url = info['url']
+        return await self.resolve(url)
+
+    def cached_info(self, track):
+
+        # tracks in the audio cache play without youtube as long as no filter is needed
+        if not audio_cache or self.build_fx() or (vid := video_id(track.url)) not in audio_cache:
+            return None
+
+        return {
+            'id': vid,
+            'title': track.title,
+            'uploader': track.uploader,
+            'duration': track.duration,
+            'webpage_url': track.url,
+            'thumbnail': f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg",
+            'formats': [],
+        }
+
+    async def resolve(self, url, priority=PLAY):
+
+        # PLAY only for the track that is starting, lookahead uses PREFETCH and can be refused
+
+        if (info := extract_cache.get_info(url)):
+            return info
+
+        return await inflight.run(f"info:{cache_key(url)}", self.extract_info, url, priority)
+
+    async def extract_info(self, url, priority=PLAY):
 
-        #if (yt_url := YOUTUBE_VIDEO_REG.match(url)):
-        #    url = yt_url.group()
+        info = await scheduler.run(self.inter.guild.id, extract, url, priority=priority)
 
-        to_run = partial(ytdl.extract_info, url=url, download=False)
-        info = await self.bot.loop.run_in_executor(None, to_run)
+        extract_cache.set_info(url, info)
+        self.bot.loop.run_in_executor(None, store.put_info, info)
 
         return info
 
+    async def prefetch(self, url):
+        try:
+            return await self.resolve(url, PREFETCH)
+        except SchedulerFull:
+            # busy: the track is resolved when it starts
+            return None
+        except Exception:
+            traceback.print_exc()
+
+    def update_prefetch(self):
+
+        # resolve the next track(s) while the current one plays, cancelling lookups
+        # that are no longer ahead in the queue (skip, shuffle, loop...)
+
+        if self.exiting:
+            return
+
+        upcoming = self.queue[:self.prefetch_ahead]
+
+        if self.loop and self.current:
+            upcoming.insert(0, self.current)
+
+        urls = [t.url for t in upcoming[:self.prefetch_ahead]]
+
+        for url in list(self.prefetching):
+            if url not in urls:
+                self.prefetching.pop(url).cancel()
+
+        for url in urls:
+            if url not in self.prefetching and not extract_cache.has_info(url):
+                self.prefetching[url] = self.bot.loop.create_task(self.prefetch(url))
+
+        # the pre-rolled track is no longer the next one
+        if self.preroll_track and self.preroll_track is not self.upcoming_track():
+            self.reset_preroll()
+
+    def upcoming_track(self):
+        if self.loop:
+            return self.current
+        if self.queue:
+            return self.queue[0]
+
+    async def preroll_next(self):
+
+        # opens the next track shortly before the current one ends and buffers its first
+        # frames, so the voice client can switch to it on the same frame boundary
+
+        lead = PREROLL_SECONDS + 2
+
+        while True:
+
+            remaining = (self.current.duration - self.source.position) / self.source.speed
+
+            if remaining > lead:
+                await asyncio.sleep(min(remaining - lead, 10))
+                continue
+
+            if not (track := self.upcoming_track()):
+                await asyncio.sleep(1)
+                continue
+
+            try:
+                info = self.cached_info(track) or await self.resolve(track.url, PREFETCH)
+            except Exception:
+                # reported by start_play when it gets to this track
+                return
+
+            if track is not self.upcoming_track():
+                continue
+
+            try:
+                source, info = await self.open_track(info, track=track, priority=PREFETCH)
+            except Exception:
+                return
+
+            if track is not self.upcoming_track():
+                source.cleanup()
+                continue
+
+            try:
+                vc = self.inter.guild.voice_client
+                if not source.is_opus() and not vc.encoder:
+                    vc.encoder = disnake.opus.Encoder()
+                await self.bot.loop.run_in_executor(None, source.preroll)
+            except BaseException:
+                source.cleanup()
+                raise
+
+            if track is not self.upcoming_track() or not self.chain:
+                source.cleanup()
+                continue
+
+            self.preroll_track = track
+            self.preroll_info = info
+            self.chain.pending = source
+            return
+
+    def cancel_preroll(self):
+
+        if self.preroll_task:
+            self.preroll_task.cancel()
+            self.preroll_task = None
+
+        if self.chain and (pending := self.chain.take_pending()):
+            pending.cleanup()
+
+        self.preroll_track = None
+        self.preroll_info = None
+
+    def reset_preroll(self):
+        self.cancel_preroll()
+        if self.chain and self.current:
+            self.preroll_task = self.bot.loop.create_task(self.preroll_next())
+
+    def on_switch(self, old):
+        # voice thread: the pending track just started playing
+        self.bot.loop.call_soon_threadsafe(self.track_switched, old)
+
+    def track_switched(self, old):
+        old.cleanup()
+        self.switched = True
+        self.event.set()
+
+    def cancel_prefetch(self):
+        for task in self.prefetching.values():
+            task.cancel()
+        self.prefetching.clear()
+
+    def open_source(self, info, position=0, track=None):
+
+        track = track or self.current
+
+        self.fx = self.build_fx()
+
+        vid = video_id(track.url)
+
+        if not self.fx and audio_cache and (cached := audio_cache.open(vid, position)):
+            # no youtube and no ffmpeg at all, packets come straight from the file
+            return YTDLSource(cached, self.volume, position)
+
+        if not info['formats']:
+            # cached_info() found the track in the audio cache, but its file is gone
+            raise CacheMiss(vid)
+
+        ffmpg_opts = dict(FFMPEG_OPTIONS)
+
+        if position:
+            ffmpg_opts['before_options'] = f"-ss {position:.2f} " + ffmpg_opts['before_options']
+
+        if self.fx:
+            ffmpg_opts['options'] += (f" -af \"" + ", ".join(self.fx) + "\"")
+
+        # without effects or volume changes the opus stream is copied, no decode/encode needed
+        with tracer.span("select_format") as span:
+            url, passthrough = select_format(info['formats'], opus=not self.fx)
+            span.set(passthrough=passthrough)
+
+        with tracer.span("ffmpeg_spawn", shared=bool(broker)):
+            if broker:
+                if passthrough:
+                    factory = partial(disnake.FFmpegOpusAudio, url, codec='opus', **ffmpg_opts)
+                else:
+                    factory = partial(disnake.FFmpegPCMAudio, url, **ffmpg_opts)
+                source = broker.subscribe((cache_key(track.url), tuple(self.fx)), factory, passthrough, start=position)
+            elif passthrough:
+                source = disnake.FFmpegOpusAudio(url, codec='opus', **ffmpg_opts)
+            else:
+                source = disnake.FFmpegPCMAudio(url, **ffmpg_opts)
+
+        if passthrough and not position and track.duration and audio_cache and vid and audio_cache.should_record(vid):
+            source = audio_cache.recorder(vid, source, track.duration)
+
+        return YTDLSource(source, self.volume, position, 1.25 if self.nightcore else 1.0)
+
+    async def open_track(self, info, position=0, track=None, priority=PLAY):
+
+        # open_source, resolving the track when it can't play from the audio cache after
+        # all. returns the source and the info it was opened from
+
+        try:
+            return self.open_source(info, position, track), info
+        except CacheMiss:
+            info = await self.resolve((track or self.current).url, priority)
+            return self.open_source(info, position, track), info
+
+    async def restart(self, position=None):
+
+        # reopens the current track at the same position (or at `position`) with the current
+        # filters and swaps it into the voice client, reusing the already resolved stream url
+
+        vc = self.inter.guild.voice_client
+        old = self.source
+
+        if not self.current or not old or not self.chain or not vc:
+            return False
+
+        if position is None:
+            position = old.position
+
+        info = self.current_info
+
+        # tracks from the audio cache have no stream url yet, only needed for the filters
+        if (not info['formats'] and self.build_fx()) or ((expires := stream_expire(info)) and expires - 30 < time.time()):
+            info = await self.resolve(self.current.url)
+            if self.source is not old:
+                return False
+            self.current_info = info
+
+        source, info = await self.open_track(info, position)
+
+        if self.source is not old:
+            source.cleanup()
+            return False
+
+        self.current_info = info
+
+        if not source.is_opus() and not vc.encoder:
+            vc.encoder = disnake.opus.Encoder()
+
+        self.source = source
+        self.chain.replace(source).cleanup()
+
+        # a pre-rolled next track was opened with the old filters
+        self.reset_preroll()
+
+        return True
+
+    def build_fx(self):
+
+        fx = []
+
+        if self.nightcore:
+            fx.append(filters['nightcore'])
+
+        if self.volume != 100:
+            fx.append(filters['volume'].format(volume=self.volume / 100))
+
+        return fx
+
+    def first_frame(self, requested, span):
+
+        # called from the voice thread
+        span.finish()
+
+        if requested:
+            self.bot.loop.call_soon_threadsafe(FIRST_AUDIO_SECONDS.observe, time.perf_counter() - requested)
+
+        if "first_audio" not in startup.phases:
+            self.bot.loop.call_soon_threadsafe(startup.mark, "first_audio")
+
     def ffmpeg_after(self, e):
 
         if e:
             print(f"ffmpeg error: {e}")
 
+        self.gap_started = time.perf_counter()
         self.event.set()
 
     async def start_play(self):
@@ -200,91 +846,155 @@ class MusicPlayer:
 
         self.event.clear()
 
+        # continues the trace of the /music play that started the player, the following
+        # tracks start traces of their own
+        span = tracer.span("start_play", parent=self.play_span, guild_id=self.inter.guild.id)
+        self.play_span = None
+
         try:
-            info = await self.renew_url()
+            with tracer.use(span):
+                info = await self.renew_url()
         except Exception as e:
-            traceback.print_exc()
-            try:
-                await self.inter.channel.send(embed=disnake.Embed(
-                    description=f"**Ocorreu um erro durante a reprodução da música:\n[{self.current['title']}]({self.current['webpage_url']})** ```css\n{e}\n```",
-                    color=12255232()))
-            except:
-                pass
-            self.locked = True
-            await asyncio.sleep(6)
-            self.locked = False
-            await self.process_next()
-            return
-
-        url = ""
-        for format in info['formats']:
-            if format['ext'] == 'm4a':
-                url = format['url']
-                break
-        if not url:
-            url = info['formats'][0]['url']
-
-        ffmpg_opts = dict(FFMPEG_OPTIONS)
-
-        self.fx = []
-
-        if self.nightcore:
-            self.fx.append(filters['nightcore'])
+            await self.play_failed(span, e)
+            return
 
-        if self.fx:
-            ffmpg_opts['options'] += (f" -af \"" + ", ".join(self.fx) + "\"")
+        span.set(title=self.current.title, url=self.current.url)
 
         try:
             if self.channel != self.inter.me.voice.channel:
                 self.channel = self.inter.me.voice.channel
-                await self.inter.guild.voice_client.move_to(self.channel)
+                with tracer.span("voice_move", parent=span):
+                    await self.inter.guild.voice_client.move_to(self.channel)
         except AttributeError:
             print("teste: Bot desconectado após obter download da info.")
+            span.finish(error="disconnected")
             return
 
-        source = await YTDLSource.source(url, ffmpeg_opts=ffmpg_opts)
-        source.volume = self.volume / 100
+        try:
+            with tracer.use(span):
+                self.source, info = await self.open_track(info, self.resume_at)
+        except Exception as e:
+            await self.play_failed(span, e)
+            return
 
-        self.inter.guild.voice_client.play(source, after=lambda e: self.ffmpeg_after(e))
+        self.current_info = info
+        self.resume_at = 0
 
-        if self.no_message:
-            self.no_message = False
-        else:
-            try:
-                embed = disnake.Embed(
-                    description=f"**Tocando agora:**\n[**{info['title']}**]({info['webpage_url']})\n\n**Duração:** `{datetime.timedelta(seconds=info['duration'])}`",
-                    color=12035816,
-                )
+        self.chain = GaplessSource(self.source, self.on_switch)
 
-                thumb = info.get('thumbnail')
+        requested = self.requested_at
+        self.requested_at = None
 
-                if self.loop:
-                    embed.description += " **| Repetição:** `ativada`"
+        if requested or tracer.enabled or "first_audio" not in startup.phases:
+            self.source.on_first_frame = partial(self.first_frame, requested, tracer.span("first_packet", parent=span))
 
-                if self.nightcore:
-                    embed.description += " **| Nightcore:** `Ativado`"
-                    
+        self.inter.guild.voice_client.play(self.chain, after=lambda e: self.ffmpeg_after(e))
 
-                if thumb:
-                    embed.set_thumbnail(url=thumb)
+        span.finish()
 
-                self.now_playing = await self.inter.channel.send(embed=embed)
+        if self.gap_started:
+            self.gaps.append(gap := time.perf_counter() - self.gap_started)
+            GAP_SECONDS.observe(gap)
+            self.gap_started = None
 
-            except Exception:
-                traceback.print_exc()
+        while True:
+
+            if audio_cache and (vid := video_id(self.current.url)):
+                audio_cache.played(vid)
 
-        await self.event.wait()
+            self.update_prefetch()
+            self.reset_preroll()
 
-        source.cleanup()
+            self.send_now_playing(info)
+
+            await self.event.wait()
+            self.event.clear()
+
+            if not self.switched:
+                break
+
+            # the pre-rolled track is already playing, no gap at all
+            self.switched = False
+            self.gaps.append(0.0)
+            GAP_SECONDS.observe(0.0)
+
+            if self.loop:
+                self.no_message = True
+            elif self.queue and self.queue[0] is self.preroll_track:
+                self.queue.popleft()
+            elif self.preroll_track in self.queue:
+                # the queue changed right as the track switched
+                self.queue.remove(self.preroll_track)
+
+            self.current = self.preroll_track
+            self.current_info = info = self.preroll_info
+            self.source = self.chain.active
+            self.preroll_track = self.preroll_info = None
+
+        self.cancel_preroll()
+        self.chain.cleanup()
+        self.chain = None
+        self.source = None
+        self.current_info = None
 
         if self.loop:
-            self.queue.insert(0, self.current)
+            self.queue.appendleft(self.current)
             self.no_message = True
 
         self.current = None
 
         await self.process_next()
 
+    async def play_failed(self, span, e):
+
+        span.finish(error=repr(e))
+        self.resume_at = 0
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+        try:
+            await self.inter.channel.send(embed=disnake.Embed(
+                description=f"**Ocorreu um erro durante a reprodução da música:\n[{self.current.title}]({self.current.url})** ```css\n{e}\n```",
+                color=12255232))
+        except:
+            pass
+
+        # nothing is playing anymore, the next track starts from a clean state
+        self.current = None
+        self.current_info = None
+
+        self.locked = True
+        await asyncio.sleep(6)
+        self.locked = False
+        await self.process_next()
+
+    def send_now_playing(self, info):
+
+        if self.no_message:
+            self.no_message = False
+            return
+
+        try:
+            embed = disnake.Embed(
+                description=f"**Tocando agora:**\n[**{info['title']}**]({info['webpage_url']})\n\n**Duração:** `{datetime.timedelta(seconds=info['duration'])}`",
+                color=12035816,
+            )
+
+            thumb = info.get('thumbnail')
+
+            if self.loop:
+                embed.description += " **| Repetição:** `ativada`"
+
+            if self.nightcore:
+                embed.description += " **| Nightcore:** `Ativado`"
+
+            if thumb:
+                embed.set_thumbnail(url=thumb)
+
+            self.now_playing.update(embed=embed)
+
+        except Exception:
+            traceback.print_exc()
+
 
 class music(commands.Cog):
     def __init__(self, bot):
@@ -294,6 +1004,235 @@ class music(commands.Cog):
 
         self.bot = bot
 
+        self.loop_lag = 0.0
+        self.warm_task = None
+        self.resume_task = None
+        # guild_id -> what the last snapshot saw, to only rewrite the players that changed
+        self.snapshots = {}
+
+        self.store_task = bot.loop.create_task(self.flush_store())
+        self.lag_task = bot.loop.create_task(self.watch_loop_lag())
+        self.snapshot_task = bot.loop.create_task(self.snapshot_players())
+
+        self.register_metrics()
+
+    def cog_unload(self):
+        self.store_task.cancel()
+        self.lag_task.cancel()
+        self.snapshot_task.cancel()
+        store.flush()
+
+    async def snapshot_players(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            try:
+                await self.save_snapshot()
+            except Exception:
+                traceback.print_exc()
+
+    async def save_snapshot(self):
+
+        changed, positions, live, states = [], [], set(), {}
+
+        for guild_id, player in list(self.bot.players.items()):
+
+            if player.exiting or not player.channel or not (player.current or player.queue):
+                continue
+
+            live.add(guild_id)
+
+            position = player.source.position if player.source else 0.0
+            state = (player.queue.version, player.current, player.loop, player.nightcore, player.volume, player.channel.id)
+
+            if self.snapshots.get(guild_id) == state:
+                positions.append((position, guild_id))
+                continue
+
+            states[guild_id] = state
+
+            # packed in the executor, the tracks are copied here while nothing can change them
+            changed.append((
+                guild_id, player.channel.id, player.inter.channel.id,
+                {'loop': player.loop, 'nightcore': player.nightcore, 'volume': player.volume},
+                player.current, position, list(player.queue)
+            ))
+
+        # stopped players and the ones with nothing left to play
+        deleted = [guild_id for guild_id in self.snapshots if guild_id not in live]
+
+        if not (changed or positions or deleted):
+            return
+
+        def save():
+            store.save_players(
+                [
+                    (guild_id, voice_id, text_id, json.dumps(settings), pack_tracks([current]) if current else None, position, pack_tracks(queue))
+                    for guild_id, voice_id, text_id, settings, current, position, queue in changed
+                ],
+                positions,
+                deleted
+            )
+
+        await self.bot.loop.run_in_executor(None, save)
+
+        # only once written: a failed save is retried on the next snapshot
+        self.snapshots.update(states)
+
+        for guild_id in deleted:
+            self.snapshots.pop(guild_id, None)
+
+    @commands.Cog.listener("on_ready")
+    async def start_resume(self):
+        if not self.resume_task:
+            self.resume_task = self.bot.loop.create_task(self.resume_players())
+
+    async def resume_players(self):
+
+        rows = await self.bot.loop.run_in_executor(None, store.load_players)
+
+        for guild_id, voice_id, text_id, settings, current, position, queue in rows:
+
+            # other clusters resume their own guilds
+            if not (guild := self.bot.get_guild(guild_id)) or guild_id in self.bot.players:
+                continue
+
+            # each guild on its own task, a voice connection that hangs only holds up its
+            # own guild. the stream urls are resolved when each track starts: spacing the
+            # guilds out keeps a deploy from turning into a burst of extractions
+            self.bot.loop.create_task(self.resume_guild(guild, voice_id, text_id, settings, current, position, queue))
+            await asyncio.sleep(1 / RESUME_RATE)
+
+    async def resume_guild(self, guild, voice_id, text_id, settings, current, position, queue):
+
+        try:
+            resumed = await self.resume_player(guild, voice_id, text_id, json.loads(settings), current, position, queue)
+        except Exception:
+            traceback.print_exc()
+            resumed = False
+
+        if not resumed:
+            if (player := self.bot.players.get(guild.id)) and isinstance(player.inter, ResumedInteraction) and not player.current:
+                del self.bot.players[guild.id]
+                if guild.voice_client:
+                    guild.voice_client.cleanup()
+            await self.bot.loop.run_in_executor(None, store.delete_player, guild.id)
+
+    async def resume_player(self, guild, voice_id, text_id, settings, current, position, queue):
+
+        channel = guild.get_channel(voice_id)
+        text_channel = guild.get_channel(text_id)
+
+        if not channel or not text_channel or not any(not m.bot for m in channel.members):
+            return False
+
+        # someone started the player again while this guild waited for its turn
+        if guild.id in self.bot.players:
+            return False
+
+        inter = ResumedInteraction(self.bot, self, guild, text_channel)
+        player = inter.player = self.get_player(inter)
+
+        player.loop = settings['loop']
+        player.nightcore = settings['nightcore']
+        player.volume = settings['volume']
+        player.queue.extend(unpack_tracks(queue))
+
+        if current:
+            player.queue.appendleft(unpack_tracks(current)[0])
+            player.resume_at = position
+
+        player.channel = channel
+
+        if not guild.voice_client:
+            await channel.connect(timeout=30, reconnect=False)
+
+        embed = disnake.Embed(
+            description="🔁 | Fui reiniciada, continuando a música de onde parou!",
+            color=12035816
+        )
+        await text_channel.send(embed=embed)
+
+        player.start()
+
+        return True
+
+    @commands.Cog.listener("on_ready")
+    async def start_warm_up(self):
+        # after the gateway is up, so it doesn't compete with the login and guild chunks
+        if not self.warm_task:
+            self.warm_task = self.bot.loop.create_task(self.warm_up())
+
+    async def warm_up(self):
+
+        try:
+            # the bot process runs the thread mode extractions and the playlist walks. process
+            # workers are forked from the forkserver, which preloads yt-dlp, and are started
+            # and warmed up each on their own by the scheduler
+            await self.bot.loop.run_in_executor(None, warm_up)
+            await scheduler.warm_up(warm_up)
+        except Exception:
+            traceback.print_exc()
+
+        startup.mark("warm_up")
+
+    def register_metrics(self):
+
+        players = lambda: list(self.bot.players.values())
+
+        def executor_queue():
+            executor = getattr(self.bot.loop, '_default_executor', None)
+            return executor._work_queue.qsize() if executor else 0
+
+        registry.gauge("minji_players", "active players", lambda: len(self.bot.players))
+        registry.gauge("minji_players_playing", "players with a track playing", lambda: sum(1 for p in players() if p.current))
+        registry.histogram("minji_queue_length", "queued tracks per player", SIZE_BUCKETS, lambda: [len(p.queue) for p in players()])
+        registry.gauge("minji_ffmpeg_processes", "running ffmpeg processes", lambda: child_processes("ffmpeg"))
+        registry.gauge("minji_extract_jobs", "extraction scheduler jobs", lambda: {
+            'pending': (stats := scheduler.stats())['pending'], 'running': stats['running']
+        }, label="state")
+        registry.gauge("minji_extract_cache_hits", "extract cache hits", lambda: {
+            name: cache.hits for name, cache in (('searches', extract_cache.searches), ('infos', extract_cache.infos))
+        }, label="cache")
+        registry.gauge("minji_extract_cache_misses", "extract cache misses", lambda: {
+            name: cache.misses for name, cache in (('searches', extract_cache.searches), ('infos', extract_cache.infos))
+        }, label="cache")
+        registry.gauge("minji_extract_cache_size", "entries in the extract cache", lambda: {
+            name: len(cache) for name, cache in (('searches', extract_cache.searches), ('infos', extract_cache.infos))
+        }, label="cache")
+        registry.gauge("minji_extract_deduplicated", "extractions saved by joining an identical one already running", lambda: inflight.saved)
+        registry.gauge("minji_shared_decoders", "ffmpeg processes shared between guilds (SHARED_SOURCES)", lambda: broker.stats()['decoders'] if broker else None)
+        registry.gauge("minji_shared_subscribers", "players reading from a shared ffmpeg process", lambda: broker.stats()['subscribers'] if broker else None)
+        registry.gauge("minji_shared_hits", "players that joined an ffmpeg process already running for another guild", lambda: broker.shared if broker else None)
+        registry.gauge("minji_store_lookups", "lookups in the persistent extract store", lambda: {
+            'hit': (stats := store.stats())['hits'], 'miss': stats['misses']
+        }, label="result")
+        registry.gauge("minji_store_pending_writes", "extract store writes waiting for the next flush", lambda: store.stats()['pending'])
+        registry.gauge("minji_audio_cache_lookups", "tracks opened from the audio cache (AUDIO_CACHE_DIR) or not", lambda: {
+            'hit': audio_cache.hits, 'miss': audio_cache.misses
+        } if audio_cache else None, label="result")
+        registry.gauge("minji_audio_cache_bytes", "size of the audio cache", lambda: audio_cache.total if audio_cache else None)
+        registry.gauge("minji_executor_queue", "jobs waiting for the default thread executor", executor_queue)
+        registry.gauge("minji_loop_lag_last_seconds", "last measured event loop lag", lambda: self.loop_lag)
+        registry.gauge("minji_channel_updates", "now playing messages sent, edited and updates merged into a later edit", lambda: dict(live_message.stats), label="kind")
+        registry.gauge("minji_idle_players", "players waiting to be disconnected for inactivity", lambda: len(idle))
+        registry.gauge("minji_idle_reclaimed", "players disconnected for inactivity", lambda: idle.reclaimed)
+        registry.gauge("minji_idle_freed_bytes", "memory returned to the os after disconnecting idle players", lambda: idle.freed)
+
+    async def watch_loop_lag(self, interval=0.5):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, time.perf_counter() - started - interval)
+            LOOP_LAG_SECONDS.observe(self.loop_lag)
+
+    async def flush_store(self):
+        while True:
+            await asyncio.sleep(30)
+            try:
+                await self.bot.loop.run_in_executor(None, store.flush)
+            except Exception:
+                traceback.print_exc()
+
     def get_player(self, inter):
         try:
             player = inter.bot.players[inter.guild.id]
@@ -307,11 +1246,11 @@ class music(commands.Cog):
 
         inter.player.exiting = True
         inter.player.loop = False
+        inter.player.cancel_prefetch()
+        inter.player.cancel_preroll()
 
-        try:
-            inter.player.timeout_task.cancel()
-        except:
-            pass
+        idle.cancel(inter.guild.id)
+        inter.player.now_playing.close()
 
         del self.bot.players[inter.guild.id]
 
@@ -321,7 +1260,19 @@ class music(commands.Cog):
             inter.guild.voice_client.cleanup()
 
     # searching the item on youtube
-    async def search_yt(self, item):
+    async def search_yt(self, item, guild_id=None):
+
+        started = time.perf_counter()
+
+        try:
+            with tracer.span("search_yt", query=item):
+                return await self.find_tracks(item, guild_id)
+        finally:
+            SEARCH_SECONDS.observe(time.perf_counter() - started)
+
+    async def find_tracks(self, item, guild_id):
+
+        priority = SEARCH
 
         if (yt_url := YOUTUBE_VIDEO_REG.match(item)):
             item = yt_url.group()
@@ -329,8 +1280,21 @@ class music(commands.Cog):
         elif not URL_REG.match(item):
             item = f"ytsearch:{item}"
 
-        to_run = partial(ytdl.extract_info, url=item, download=False)
-        info = await self.bot.loop.run_in_executor(None, to_run)
+        else:
+            priority = PLAYLIST
+
+        if (tracks := extract_cache.get_search(item)) is not None:
+            return tracks
+
+        return await inflight.run(f"search:{cache_key(item)}", self.extract_tracks, item, guild_id, priority)
+
+    async def extract_tracks(self, item, guild_id, priority):
+
+        if (tracks := await self.bot.loop.run_in_executor(None, store.get_tracks, cache_key(item))) is not None:
+            extract_cache.set_search(item, tracks)
+            return tracks
+
+        info = await scheduler.run(guild_id, extract, item, priority=priority)
 
         try:
             entries = info["entries"]
@@ -340,28 +1304,53 @@ class music(commands.Cog):
         if info["extractor_key"] == "YoutubeSearch":
             entries = entries[:1]
 
-        tracks = []
+        tracks = build_tracks(entries)
 
-        for t in entries:
+        if tracks:
+            extract_cache.set_search(item, tracks)
+            self.bot.loop.run_in_executor(None, store.put_tracks, cache_key(item), tracks)
 
-            if not (duration:=t.get('duration')):
-                continue
+        return tracks
 
-            url = t.get('webpage_url') or t['url']
+    # playlists are added page by page while yt-dlp is still going through them
+    async def stream_yt(self, item, guild_id=None):
 
-            if not URL_REG.match(url):
-                url = f"https://www.youtube.com/watch?v={url}"
+        loop = asyncio.get_running_loop()
 
-            tracks.append(
-                {
-                    'url': url,
-                    'title': fix_characters(t['title']),
-                    'uploader': t['uploader'],
-                    'duration': duration
-                }
-            )
+        if (tracks := extract_cache.get_search(item)) is None:
+            if (tracks := await loop.run_in_executor(None, store.get_tracks, cache_key(item))) is not None:
+                extract_cache.set_search(item, tracks)
 
-        return tracks
+        if tracks is not None:
+            if tracks:
+                yield tracks
+            return
+        pages = asyncio.Queue()
+        stopped = False
+
+        def emit(entries):
+            loop.call_soon_threadsafe(pages.put_nowait, entries)
+            return not stopped
+
+        job = loop.create_task(scheduler.run(guild_id, extract_pages, item, emit, priority=PLAYLIST, threaded=True))
+        job.add_done_callback(lambda t: pages.put_nowait(None))
+
+        tracks = []
+
+        try:
+            while (entries := await pages.get()) is not None:
+                if (batch := build_tracks(entries)):
+                    tracks.extend(batch)
+                    yield batch
+            await job
+        finally:
+            stopped = True
+            if not job.done():
+                job.cancel()
+
+        if tracks:
+            extract_cache.set_search(item, tracks)
+            loop.run_in_executor(None, store.put_tracks, cache_key(item), tracks)
 
 
 
@@ -390,9 +1379,25 @@ class music(commands.Cog):
 
         query = query.strip("<>")
 
+        inter.requested_at = time.perf_counter()
+
         try:
-            await inter.response.defer(ephemeral=False)
-            songs = await self.search_yt(query)
+            with tracer.span("defer"):
+                await inter.response.defer(ephemeral=False)
+
+            # links that aren't a single youtube video (playlists...) are added while they load
+            if URL_REG.match(query) and not YOUTUBE_VIDEO_REG.match(query):
+                await self.play_playlist(inter, query)
+                return
+
+            songs = await self.search_yt(query, inter.guild.id)
+        except SchedulerFull:
+            embedvc = disnake.Embed(
+                colour=12255232,  # red
+                description='⏳ | Estou recebendo muitos pedidos no momento, tente novamente em alguns segundos.'
+            )
+            await inter.edit_original_message(embed=embedvc)
+            return
         except Exception as e:
             traceback.print_exc()
             embedvc = disnake.Embed(
@@ -411,20 +1416,61 @@ class music(commands.Cog):
             return
 
         if not inter.player:
-            inter.player = self.get_player(inter)
+            with tracer.span("get_player"):
+                inter.player = self.get_player(inter)
 
         player = inter.player
 
-        vc_channel = inter.author.voice.channel
-
         if (size := len(songs)) > 1:
             txt = f"Wow! {size} músicas!"
         else:
             txt = f"🎶 - {songs[0]['title']}"
 
-        for song in songs:
-            song['requester'] = inter.author
-            player.queue.append(song)
+        player.queue.extend(Track.from_dict(song, inter.author.id) for song in songs)
+
+        await inter.edit_original_message(embed=self.queued_embed(txt))
+
+        await self.start_player(inter, player)
+
+    async def play_playlist(self, inter, query):
+
+        player = None
+        size = 0
+        title = None
+        last_edit = time.monotonic()
+
+        async for songs in self.stream_yt(query, inter.guild.id):
+
+            if not player:
+                with tracer.span("get_player"):
+                    player = inter.player = self.get_player(inter)
+
+            elif player.exiting or self.bot.players.get(inter.guild.id) is not player:
+                # the player was stopped while the playlist was still loading
+                return
+
+            player.queue.extend(Track.from_dict(song, inter.author.id) for song in songs)
+
+            size += len(songs)
+            title = title or songs[0]['title']
+
+            await self.start_player(inter, player)
+
+            if time.monotonic() - last_edit > 3:
+                last_edit = time.monotonic()
+                await inter.edit_original_message(embed=self.queued_embed(f"Wow! {size} músicas! (carregando mais...)"))
+
+        if not size:
+            embedvc = disnake.Embed(
+                colour=12255232,  # red
+                description=f'Não houve resultados para sua busca: **{query}**'
+            )
+            await inter.edit_original_message(embed=embedvc)
+            return
+
+        await inter.edit_original_message(embed=self.queued_embed(f"Wow! {size} músicas!" if size > 1 else f"🎶 - {title}"))
+
+    def queued_embed(self, txt):
 
         embedvc = disnake.Embed(
             colour=12035816,  #minji color
@@ -434,14 +1480,23 @@ class music(commands.Cog):
         embedvc.add_field(name="Você pediu para tocar:", value=f"{txt}", inline=True)
         embedvc.set_thumbnail(url="https://64.media.tumblr.com/435cf517e2940f7525d4c33a10d92890/5a54d42126692741-18/s400x600/ecd5ba5bb2efc6e30430bf2abf2864d68e3cbcc9.png")
 
-        await inter.edit_original_message(embed=embedvc)
+        return embedvc
+
+    async def start_player(self, inter, player):
+
+        if player.current:
+            player.update_prefetch()
 
         if not inter.guild.voice_client or not inter.guild.voice_client.is_connected():
-            player.channel = vc_channel
-            await vc_channel.connect(timeout=None, reconnect=False)
+            player.channel = inter.author.voice.channel
+            with tracer.span("voice_connect"):
+                await player.channel.connect(timeout=None, reconnect=False)
 
-        if not inter.guild.voice_client.is_playing() or inter.guild.voice_client.is_paused():
-            await player.process_next()
+        # the player keeps running on its own task, more songs may still be on the way
+        if not player.running() and not inter.guild.voice_client.is_playing():
+            player.requested_at = getattr(inter, 'requested_at', None)
+            player.play_span = tracer.current()
+            player.start()
 
     @music.sub_command(name="queue", description="「🎶 Minji Sound」Mostra as atuais músicas da fila.")
     async def q(self, inter: disnake.ApplicationCommandInteraction):
@@ -465,24 +1520,8 @@ class music(commands.Cog):
             await inter.send(embed=embedvc)
             return
 
-        retval = ""
-
-        def limit(text):
-            if len(text) > 30:
-                return text[:28] + "..."
-            return text
-
-        for n, i in enumerate(player.queue[:20]):
-            retval += f'**{n + 1} | `{datetime.timedelta(seconds=i["duration"])}` - ** [{limit(i["title"])}]({i["url"]}) | {i["requester"].mention}\n'
-
-        if (qsize := len(player.queue)) > 20:
-            retval += f"\nE mais **{qsize - 20}** música(s)"
-
-        embedvc = disnake.Embed(
-            colour=12035816,
-            description=f"{retval}"
-        )
-        await inter.send(embed=embedvc)
+        view = QueueView(inter, player)
+        await inter.send(embed=view.embed(), view=view)
 
     @is_requester()
     @music.sub_command(name="skip", description="「🎶 Minji Sound」Pula a música atual que está tocando.")
@@ -548,7 +1587,8 @@ class music(commands.Cog):
             await inter.send(embed=embed)
             return
 
-        shuffle(player.queue)
+        player.queue.shuffle()
+        player.update_prefetch()
 
         embed.description = f"Você misturou as músicas da fila."
         embed.colour =12035816
@@ -571,6 +1611,7 @@ class music(commands.Cog):
             return
 
         player.loop = not player.loop
+        player.update_prefetch()
 
         embed.colour =12035816
         embed.description = f"**Repetição {'ativada para a música atual' if player.loop else 'desativada'}.**"
@@ -594,16 +1635,53 @@ class music(commands.Cog):
              return
 
         player.nightcore = not player.nightcore
-        player.queue.insert(0, player.current)
-        player.no_message = True
 
-        inter.guild.voice_client.stop()
+        await player.restart()
 
         embed.description = f"**Efeito nightcore {'ativado' if player.nightcore else 'desativado'}.**"
         embed.colour =12035816
 
         await inter.send(embed=embed)
 
+    @is_requester()
+    @music.sub_command(description="「🎶 Minji Sound」Ir para um tempo específico da música atual.")
+    async def seek(
+            self,
+            inter: disnake.ApplicationCommandInteraction,
+            position: str = commands.Param(name="tempo", description="Tempo da música (ex: 1:30 ou 90)")
+    ):
+
+        player = inter.player
+
+        embed = disnake.Embed(color=12255232)
+
+        if not player or not player.current:
+            embed.title = "Aí fica difícil, amigo!"
+            embed.description = "💔 | Minji não está ativa no momento..."
+            await inter.send(embed=embed)
+            return
+
+        try:
+            seconds = parse_time(position)
+        except ValueError:
+            embed.description = "🚫 | Tempo inválido, use por exemplo: `1:30` ou `90`."
+            await inter.send(embed=embed)
+            return
+
+        if seconds >= player.current.duration:
+            embed.description = f"🚫 | A música tem apenas `{datetime.timedelta(seconds=player.current.duration)}`."
+            await inter.send(embed=embed)
+            return
+
+        if not await player.restart(seconds):
+            embed.description = "🚫 | Não foi possível mudar o tempo da música agora, tente novamente."
+            await inter.send(embed=embed)
+            return
+
+        embed.colour = 12035816
+        embed.description = f"**Música avançada para** `{datetime.timedelta(seconds=seconds)}`"
+        await inter.send(embed=embed)
+
     @music.sub_command(description="「🎶 Minji Sound」Parar o player e me desconectar do canal de voz.")
     async def stop(self, inter: disnake.ApplicationCommandInteraction):
 
@@ -676,16 +1754,23 @@ class music(commands.Cog):
         vc = inter.guild.voice_client
 
         if not vc or not vc.is_connected():
+            embedvc = disnake.Embed(colour=12255232)
             embedvc.title="Aí fica difícil, amigo!"
             embedvc.description = "💔 | Não estou conectada em um canal de voz."
             await inter.send(embed=embedvc)
+            return
 
         player = self.get_player(inter)
 
-        if vc.source:
-            vc.source.volume = value / 100
+        player.volume = value
 
-        player.volume = value / 100
+        if player.source:
+            # pcm sources take the change right away, otherwise the track restarts with the new filters
+            if not player.source.set_volume(value) and (value != 100 or not player.source.is_opus()):
+                await player.restart()
+            elif player.chain and not ((pending := player.chain.pending) and pending.set_volume(value)):
+                # the next track may already be open (or opening) with the old volume baked in
+                player.reset_preroll()
         embed = disnake.Embed(description=f"**Volume alterado para {value}%**", color=12255232)
         await inter.send(embed=embed)
 
@@ -710,6 +1795,14 @@ class music(commands.Cog):
 
         inter.player = self.bot.players.get(inter.guild.id)
 
+        inter.span = tracer.activate(tracer.span(
+            f"/{inter.application_command.qualified_name}", parent=None, guild_id=inter.guild.id
+        ))
+
+    async def cog_after_slash_command_invoke(self, inter):
+
+        inter.span.finish()
+
 
 def setup(client):
     client.add_cog(music(client))
\ No newline at end of file
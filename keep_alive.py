@@ -1,12 +1,77 @@
-import tornado.web
-
-import logging
-logging.getLogger('tornado.access').disabled = True
-
-class MainHandler(tornado.web.RequestHandler):
-    def get(self):
-        self.write(""parabéns amigo, você é um amigo!")
-
-def keep_alive():
-  app = tornado.web.Application([(r"/", MainHandler)])
-  app.listen(8080)
+import json
+import math
+import os
+
+import tornado.web
+
+from utils import startup
+from utils.metrics import registry
+
+import logging
+logging.getLogger('tornado.access').disabled = True
+
+class MainHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("parabéns amigo, você é um amigo!")
+
+class HealthHandler(tornado.web.RequestHandler):
+
+    # state of this cluster only, every cluster process listens on its own port
+    def get(self):
+        bot = self.application.settings['bot']
+        players = list(getattr(bot, 'players', {}).values())
+
+        shards = {
+            shard_id: {'latency': shard.latency if math.isfinite(shard.latency) else None, 'closed': shard.is_closed()}
+            for shard_id, shard in bot.shards.items()
+        }
+
+        if not bot.is_ready() or any(s['closed'] for s in shards.values()):
+            self.set_status(503)
+
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({
+            'cluster': getattr(bot, 'cluster_id', 0),
+            'ready': bot.is_ready(),
+            'shards': shards,
+            'guilds': len(bot.guilds),
+            'players': len(players),
+            'playing': sum(1 for p in players if p.current),
+            'queued': sum(len(p.queue) for p in players),
+            'startup': startup.phases,
+        }))
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(registry.render())
+
+class ProfileHandler(tornado.web.RequestHandler):
+
+    # /profile?seconds=10&token=..., only when PROFILE_TOKEN is set
+    async def get(self):
+        token = os.environ.get("PROFILE_TOKEN")
+        cog = self.application.settings['bot'].get_cog("debug")
+
+        if not token or self.get_argument("token", None) != token or not cog:
+            raise tornado.web.HTTPError(404)
+
+        seconds = min(max(float(self.get_argument("seconds", 10)), 1), 120)
+
+        if not (result := await cog.run_profile(seconds, self.get_argument("threads", "") == "all")):
+            raise tornado.web.HTTPError(409)
+
+        profiler, path = result
+
+        self.set_header("Content-Type", "text/plain")
+        self.set_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        self.write(profiler.folded())
+
+def keep_alive(bot=None):
+  app = tornado.web.Application([
+      (r"/", MainHandler),
+      (r"/health", HealthHandler),
+      (r"/metrics", MetricsHandler),
+      (r"/profile", ProfileHandler),
+  ], bot=bot)
+  app.listen(int(os.environ.get("PORT", 8080)))
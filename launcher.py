@@ -0,0 +1,124 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+# runs the bot as several processes ("clusters"), each one with its own event loop,
+# players and extraction workers, and a contiguous range of the shards.
+#
+#   SHARD_COUNT  total shards (default: what discord recommends for the token)
+#   CLUSTERS     processes to spread them over (default: one per cpu)
+#   PORT         keep_alive port of cluster 0, cluster n listens on PORT + n
+#
+# discord lets `max_concurrency` shards identify every 5 seconds, so the clusters start
+# one after the other, each once the shards before it had their turn. a cluster that
+# crashes is restarted, later and later while it keeps crashing right after starting.
+
+TOKEN = os.environ.get("TOKEN")
+
+IDENTIFY_INTERVAL = 5
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+# a cluster that ran this long before exiting is restarted without waiting longer
+HEALTHY_AFTER = 60
+
+
+def gateway_info():
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {TOKEN}", "User-Agent": "minji-music launcher"}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)
+
+
+def split(shard_count, clusters):
+    size, extra = divmod(shard_count, clusters)
+    start = 0
+    for n in range(clusters):
+        end = start + size + (n < extra)
+        yield list(range(start, end))
+        start = end
+
+
+def spawn(cluster_id, shard_ids, shard_count, port):
+    env = dict(
+        os.environ,
+        CLUSTER_ID=str(cluster_id),
+        SHARD_IDS=",".join(map(str, shard_ids)),
+        SHARD_COUNT=str(shard_count),
+        PORT=str(port + cluster_id),
+    )
+    print(f"cluster {cluster_id}: shards {shard_ids[0]}-{shard_ids[-1]}, porta {port + cluster_id}")
+    return subprocess.Popen([sys.executable, "main.py"], env=env)
+
+
+def main():
+
+    try:
+        gateway = gateway_info()
+    except Exception as e:
+        if not os.environ.get("SHARD_COUNT"):
+            raise
+        print(f"gateway indisponível ({e!r}), considerando max_concurrency 1")
+        gateway = {}
+
+    shard_count = int(os.environ.get("SHARD_COUNT") or gateway['shards'])
+    concurrency = gateway.get('session_start_limit', {}).get('max_concurrency', 1)
+    clusters = min(shard_count, int(os.environ.get("CLUSTERS", os.cpu_count() or 1)))
+    port = int(os.environ.get("PORT", 8080))
+
+    layout = list(split(shard_count, clusters))
+    now = time.monotonic()
+    start_at = {n: now + IDENTIFY_INTERVAL * (ids[0] // concurrency) for n, ids in enumerate(layout)}
+    delays = {n: RESTART_DELAY for n in start_at}
+    started = {}
+    processes = {}
+    stopping = False
+
+    def stop(*args):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+
+        now = time.monotonic()
+
+        for n, ids in enumerate(layout):
+
+            if stopping:
+                break
+
+            if (process := processes.get(n)) and process.poll() is None:
+                continue
+
+            if process:
+                # a crashed cluster only takes its own shards down, bring it back alone
+                if now - started[n] < HEALTHY_AFTER:
+                    delay, delays[n] = delays[n], min(delays[n] * 2, MAX_RESTART_DELAY)
+                else:
+                    delay = delays[n] = RESTART_DELAY
+                print(f"cluster {n} saiu com código {process.returncode}, reiniciando em {delay}s")
+                del processes[n]
+                start_at[n] = now + delay
+
+            elif now >= start_at[n]:
+                processes[n] = spawn(n, ids, shard_count, port)
+                started[n] = now
+
+        time.sleep(1)
+
+    for process in processes.values():
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
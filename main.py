@@ -1,38 +1,68 @@
+from utils import startup
 import disnake
 from disnake.ext import commands
 import os
+import time
 from keep_alive import keep_alive
 
+startup.mark("imports")
+
 intents = disnake.Intents.default()
 intents.members = True
 
-keep_alive()
-
 testing = False
 
-client = commands.Bot(
-    command_prefix = "m!",
-    case_insensitive = True,
-    intents=intents,
-)
+# set by launcher.py when the shards are split across several processes
+SHARD_COUNT = os.environ.get("SHARD_COUNT")
+SHARD_IDS = os.environ.get("SHARD_IDS")
+CLUSTER_ID = int(os.environ.get("CLUSTER_ID", 0))
 
-client.remove_command('help')
+TOKEN = os.environ.get("TOKEN")
 
-@client.event
-async def on_ready():
-    print(f'Entramos como {client.user}')
+if not TOKEN:
+    TOKEN = 'seu token aqui, caso são use os secrets do replit ou env'
 
-    await client.change_presence(activity=disnake.Activity(type=disnake.ActivityType.listening, name="minji sound"))
 
+def main():
 
-for filename in os.listdir('./cogs'):
-    if filename.endswith('.py'):
-        client.load_extension(f'cogs.{filename[:-3]}')
-        print(f"{filename} Carregado.")
+    client = commands.AutoShardedBot(
+        command_prefix = "m!",
+        case_insensitive = True,
+        intents=intents,
+        shard_count=int(SHARD_COUNT) if SHARD_COUNT else None,
+        shard_ids=[int(i) for i in SHARD_IDS.split(",")] if SHARD_IDS else None,
+    )
 
-TOKEN = os.environ.get("TOKEN")
+    client.cluster_id = CLUSTER_ID
+
+    client.remove_command('help')
+
+    keep_alive(client)
+
+    @client.event
+    async def on_connect():
+        startup.mark("connect")
+
+    @client.event
+    async def on_ready():
+        startup.mark("ready")
+
+        print(f'Entramos como {client.user} (cluster {CLUSTER_ID}, shards {sorted(client.shards)})')
+
+        await client.change_presence(activity=disnake.Activity(type=disnake.ActivityType.listening, name="minji sound"))
+
+    for filename in os.listdir('./cogs'):
+        if filename.endswith('.py'):
+            started = time.perf_counter()
+            client.load_extension(f'cogs.{filename[:-3]}')
+            print(f"{filename} Carregado em {time.perf_counter() - started:.2f}s.")
+
+    startup.mark("cogs")
+
+    client.run(TOKEN)
 
-if not TOKEN:
-    TOKEN = 'seu token aqui, caso são use os secrets do replit ou env'
 
-client.run(TOKEN)
+# the extraction workers (EXTRACT_MODE=process) import this module again as __mp_main__,
+# they must not start a second bot
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import disnake
+
+
+# tracks played often enough are kept on disk as the opus packets discord gets, so they
+# play again without youtube or ffmpeg. file format: MAGIC, then for every 20ms packet
+# a little-endian u16 length followed by the packet itself.
+
+MAGIC = b"MJOP\x01"
+LENGTH = struct.Struct("<H")
+
+
+class CacheMiss(LookupError):
+    # the file of a track the cache listed is gone (deleted by hand, evicted meanwhile)
+    pass
+
+
+class CachedOpusSource(disnake.AudioSource):
+
+    def __init__(self, path, position=0.0):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offset = len(MAGIC)
+        if position:
+            self.skip(int(position / 0.02))
+
+    def skip(self, frames):
+        for _ in range(frames):
+            if self.offset >= len(self.map):
+                return
+            self.offset += LENGTH.size + LENGTH.unpack_from(self.map, self.offset)[0]
+
+    def read(self):
+        if self.offset + LENGTH.size > len(self.map):
+            return b""
+        size, = LENGTH.unpack_from(self.map, self.offset)
+        start = self.offset + LENGTH.size
+        self.offset = start + size
+        return self.map[start:self.offset]
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        if self.map:
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+
+class RecordingSource(disnake.AudioSource):
+
+    # passes packets through while writing them to the cache, the file only
+    # becomes visible once the track was read until the end. an ffmpeg that died early
+    # (failed reconnect...) also ends with an empty read, so the packets are counted and
+    # a recording much shorter than the track is thrown away
+
+    def __init__(self, cache, vid, source, duration):
+        self.cache = cache
+        self.vid = vid
+        self.original = source
+        self.expected = duration * 50
+        self.frames = 0
+        self.temp = cache.path(vid) + f".{os.getpid()}.tmp"
+        self.file = open(self.temp, "wb")
+        self.file.write(MAGIC)
+        self.size = len(MAGIC)
+
+    def read(self):
+        data = self.original.read()
+        if self.file:
+            if data:
+                self.file.write(LENGTH.pack(len(data)))
+                self.file.write(data)
+                self.size += LENGTH.size + len(data)
+                self.frames += 1
+            else:
+                self.finish(self.frames >= self.expected * 0.98 - 50)
+        return data
+
+    def finish(self, complete):
+        self.file.close()
+        self.file = None
+        self.cache.recorded(self.vid, self.temp, self.size if complete else None)
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        if self.file:
+            self.finish(False)
+        self.original.cleanup()
+
+
+class AudioCache:
+
+    def __init__(self, directory=None, max_bytes=None, min_plays=None):
+        self.directory = directory or os.environ.get("AUDIO_CACHE_DIR", "audio_cache")
+        # clusters (launcher.py) evict and clean up by their own index: each one gets a
+        # directory, and AUDIO_CACHE_MB, of its own
+        if (cluster := os.environ.get("CLUSTER_ID")) is not None:
+            self.directory = os.path.join(self.directory, f"cluster-{cluster}")
+        self.max_bytes = max_bytes or int(os.environ.get("AUDIO_CACHE_MB", 2048)) * 1024 * 1024
+        self.min_plays = min_plays or int(os.environ.get("AUDIO_CACHE_MIN_PLAYS", 3))
+        self.files = OrderedDict()  # vid -> size, least recently used first
+        self.total = 0
+        self.plays = OrderedDict()
+        self.recording = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        entries = []
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+            elif name.endswith(".mjop"):
+                stat = os.stat(path)
+                entries.append((stat.st_atime, name[:-5], stat.st_size))
+
+        for _, vid, size in sorted(entries):
+            self.files[vid] = size
+            self.total += size
+
+    def __contains__(self, vid):
+        return vid in self.files
+
+    def path(self, vid):
+        return os.path.join(self.directory, f"{vid}.mjop")
+
+    def open(self, vid, position=0.0):
+
+        with self.lock:
+            if vid not in self.files:
+                self.misses += 1
+                return None
+
+        try:
+            source = CachedOpusSource(self.path(vid), position)
+        except OSError:
+            self.forget(vid)
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            if vid in self.files:
+                self.files.move_to_end(vid)
+            self.hits += 1
+
+        return source
+
+    def forget(self, vid):
+        with self.lock:
+            if (size := self.files.pop(vid, None)) is not None:
+                self.total -= size
+
+    def played(self, vid):
+
+        with self.lock:
+            self.plays[vid] = self.plays.get(vid, 0) + 1
+            self.plays.move_to_end(vid)
+            # only the play counts of recent tracks are kept
+            while len(self.plays) > 10000:
+                self.plays.popitem(last=False)
+
+    def should_record(self, vid):
+        # asked when the source is opened, before played() counts the play it is opened for
+        with self.lock:
+            return vid not in self.files and vid not in self.recording and self.plays.get(vid, 0) + 1 >= self.min_plays
+
+    def recorder(self, vid, source, duration):
+        with self.lock:
+            self.recording.add(vid)
+        return RecordingSource(self, vid, source, duration)
+
+    def recorded(self, vid, temp, size):
+
+        with self.lock:
+
+            self.recording.discard(vid)
+
+            if not size:
+                os.remove(temp)
+                return
+
+            os.replace(temp, self.path(vid))
+            self.files[vid] = size
+            self.total += size
+
+            # lru by total bytes, files still being played stay readable through their mmap
+            while self.total > self.max_bytes and len(self.files) > 1:
+                old, old_size = self.files.popitem(last=False)
+                self.total -= old_size
+                try:
+                    os.remove(self.path(old))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        return {'files': len(self.files), 'bytes': self.total, 'hits': self.hits, 'misses': self.misses, 'recording': len(self.recording)}
@@ -0,0 +1,134 @@
+import os
+import threading
+
+import disnake
+
+
+class SharedDecoder:
+
+    # one ffmpeg process whose frames are kept in a ring that every subscriber reads from.
+    # frames are stored once and handed out as the same bytes objects, nothing is copied per guild
+
+    def __init__(self, broker, key, source, opus, ring_size):
+        self.broker = broker
+        self.key = key
+        self.source = source
+        self.opus = opus
+        self.ring = [None] * ring_size
+        self.ring_size = ring_size
+        self.produced = 0
+        self.finished = False
+        self.subscribers = 0
+        self.read_lock = threading.Lock()
+
+    def oldest(self):
+        return max(0, self.produced - self.ring_size)
+
+    def frame(self, index):
+
+        # None: the frame already left the ring (the subscriber fell too far behind)
+
+        if index >= self.produced:
+
+            # the first subscriber to need a new frame reads it from ffmpeg
+            with self.read_lock:
+                while index >= self.produced:
+                    if self.finished:
+                        return b""
+                    if not (data := self.source.read()):
+                        self.finished = True
+                        return b""
+                    self.ring[self.produced % self.ring_size] = data
+                    self.produced += 1
+
+        if index < self.oldest():
+            return None
+
+        return self.ring[index % self.ring_size]
+
+
+class SharedSource(disnake.AudioSource):
+
+    def __init__(self, decoder, cursor=0):
+        self.decoder = decoder
+        self.cursor = cursor
+        self.released = False
+
+    def read(self):
+
+        if (data := self.decoder.frame(self.cursor)) is None:
+            # paused or too slow: continue from the oldest frame still around
+            self.cursor = self.decoder.oldest()
+            data = self.decoder.frame(self.cursor)
+
+        if data:
+            self.cursor += 1
+
+        return data
+
+    def is_opus(self):
+        return self.decoder.opus
+
+    def cleanup(self):
+        # called by both the voice client and the player
+        if not self.released:
+            self.released = True
+            self.decoder.broker.release(self.decoder)
+
+
+class SourceBroker:
+
+    def __init__(self, ring_size=None):
+        # late joiners can share a decoder while its first frame is still in the ring
+        self.ring_size = ring_size or int(os.environ.get("SHARED_RING_FRAMES", 1000))
+        self.decoders = {}
+        self.lock = threading.Lock()
+        self.shared = 0
+
+    def subscribe(self, key, factory, opus, start=0):
+
+        # key: (track, filters), start: offset in seconds the decoder was opened at
+        key = (*key, start)
+
+        with self.lock:
+
+            for decoder in self.decoders.get(key, []):
+                # leave half of the ring as slack so the late joiner doesn't fall out of it
+                if not decoder.finished and decoder.produced < self.ring_size // 2:
+                    decoder.subscribers += 1
+                    self.shared += 1
+                    return SharedSource(decoder)
+
+            decoder = SharedDecoder(self, key, factory(), opus, self.ring_size)
+            decoder.subscribers += 1
+            self.decoders.setdefault(key, []).append(decoder)
+
+        return SharedSource(decoder)
+
+    def release(self, decoder):
+
+        with self.lock:
+
+            decoder.subscribers -= 1
+
+            if decoder.subscribers > 0:
+                return
+
+            decoders = self.decoders.get(decoder.key, [])
+
+            if decoder in decoders:
+                decoders.remove(decoder)
+
+            if not decoders:
+                self.decoders.pop(decoder.key, None)
+
+        decoder.source.cleanup()
+
+    def stats(self):
+        with self.lock:
+            decoders = [d for ds in self.decoders.values() for d in ds]
+            return {
+                'decoders': len(decoders),
+                'subscribers': sum(d.subscribers for d in decoders),
+                'shared': self.shared,
+            }
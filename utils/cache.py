@@ -0,0 +1,142 @@
+import re
+import time
+from collections import OrderedDict
+
+
+VIDEO_ID_REG = re.compile(r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/)|youtu\.be/)([-\w]{11})")
+EXPIRE_REG = re.compile(r"[?&/]expire[=/](\d+)")
+
+
+def video_id(url: str):
+    if (match := VIDEO_ID_REG.search(url)):
+        return match.group(1)
+
+
+URL_REG = re.compile(r"^\s*https?://", re.IGNORECASE)
+
+
+def normalize_query(query: str):
+    return " ".join(query.lower().split())
+
+
+def cache_key(item: str):
+    # videos are shared between links (watch?v=, youtu.be, shorts...) and searches by text.
+    # other links are kept as they are, playlist ids and most paths are case sensitive
+    if (vid := video_id(item)):
+        return vid
+    if URL_REG.match(item):
+        return item.strip()
+    return normalize_query(item)
+
+
+def stream_expire(info: dict):
+    # googlevideo links carry the unix timestamp where they stop working (expire=...)
+    expires = []
+
+    for f in info.get('formats') or []:
+        if (match := EXPIRE_REG.search(f.get('url') or "")):
+            expires.append(int(match.group(1)))
+
+    if (match := EXPIRE_REG.search(info.get('url') or "")):
+        expires.append(int(match.group(1)))
+
+    return min(expires) if expires else None
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.data = OrderedDict()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        try:
+            expires, value = self.data[key]
+        except KeyError:
+            return False
+        return not expires or expires > time.time()
+
+    def get(self, key):
+
+        try:
+            expires, value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        if expires and expires <= time.time():
+            del self.data[key]
+            self.misses += 1
+            return None
+
+        self.data.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def set(self, key, value, expires=None):
+
+        if expires is None and self.ttl:
+            expires = time.time() + self.ttl
+
+        self.data[key] = (expires, value)
+        self.data.move_to_end(key)
+
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key):
+        try:
+            return self.data.pop(key)[1]
+        except KeyError:
+            return None
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self):
+        return {'size': len(self.data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class ExtractCache:
+
+    def __init__(self, search_size=1024, info_size=256, search_ttl=6 * 3600, info_ttl=1800, expire_margin=120):
+        self.searches = LRUCache(maxsize=search_size, ttl=search_ttl)
+        self.infos = LRUCache(maxsize=info_size, ttl=info_ttl)
+        self.expire_margin = expire_margin
+
+    # search results are shared between guilds and must be treated as read-only
+    def get_search(self, query: str):
+        return self.searches.get(cache_key(query))
+
+    def set_search(self, query: str, tracks: list):
+        self.searches.set(cache_key(query), tracks)
+
+    def has_info(self, url: str):
+        return cache_key(url) in self.infos
+
+    def get_info(self, url: str):
+        return self.infos.get(cache_key(url))
+
+    def set_info(self, url: str, info: dict):
+
+        if not info.get('formats'):
+            return
+
+        expires = stream_expire(info)
+
+        if expires is not None:
+            expires -= self.expire_margin
+            if expires <= time.time():
+                return
+
+        self.infos.set(cache_key(url), info, expires)
+
+    def stats(self):
+        return {'searches': self.searches.stats(), 'infos': self.infos.stats()}
@@ -0,0 +1,145 @@
+import signal
+import threading
+
+
+YDL_OPTIONS = {
+    'noplaylist': True,
+    'nocheckcertificate': True,
+    'ignoreerrors': False,
+    'logtostderr': False,
+    'quiet': True,
+    'no_warnings': True,
+    'retries': 5,
+    'extract_flat': 'in_playlist',
+    'cachedir': False,
+    'extractor_args': {
+        'youtube': {
+            'skip': [
+                'hls',
+                'dash'
+            ],
+            'player_skip': [
+                'js',
+                'configs',
+                'webpage'
+            ]
+        },
+        'youtubetab': ['webpage']
+    }
+}
+
+# only what the player uses survives the trip back from the extraction workers
+INFO_KEYS = ('id', 'title', 'uploader', 'duration', 'url', 'webpage_url', 'thumbnail', 'extractor_key', 'is_live')
+ENTRY_KEYS = ('id', 'title', 'uploader', 'duration', 'url', 'webpage_url', 'thumbnail')
+FORMAT_KEYS = ('format_id', 'url', 'ext', 'acodec', 'vcodec', 'abr', 'asr', 'filesize')
+
+ytdl = None
+ytdl_lock = threading.Lock()
+
+in_worker = False
+
+# extractors every extraction goes through, loaded ahead of the first /music play
+WARM_EXTRACTORS = ('Youtube', 'YoutubeTab', 'YoutubeSearch')
+
+
+class ExtractError(Exception):
+    pass
+
+
+def new_ytdl():
+    # yt-dlp takes a while to import, it is only loaded when first needed (or by warm_up)
+    from yt_dlp import YoutubeDL
+    return YoutubeDL(YDL_OPTIONS)
+
+
+def get_ytdl():
+    global ytdl
+    if ytdl is None:
+        with ytdl_lock:
+            if ytdl is None:
+                ytdl = new_ytdl()
+    return ytdl
+
+
+def warm_up():
+
+    # blocking: extractors and a connection to youtube, so the first search doesn't pay for them
+    ydl = get_ytdl()
+
+    for key in WARM_EXTRACTORS:
+        ydl.get_info_extractor(key)
+
+    try:
+        ydl.urlopen("https://www.youtube.com/generate_204").close()
+    except Exception as e:
+        print(f"warm-up: {e!r}")
+
+
+def init_worker():
+    global ytdl, in_worker
+
+    # ctrl+c is handled by the bot process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    in_worker = True
+
+    # never reuse the instance (and its open connections) inherited from the bot process
+    ytdl = new_ytdl()
+
+    for key in WARM_EXTRACTORS:
+        ytdl.get_info_extractor(key)
+
+
+def compact(info: dict):
+
+    result = {k: info[k] for k in INFO_KEYS if k in info}
+
+    if (formats := info.get('formats')):
+        result['formats'] = [{k: f[k] for k in FORMAT_KEYS if k in f} for f in formats]
+
+    if (entries := info.get('entries')) is not None:
+        result['entries'] = [{k: e[k] for k in ENTRY_KEYS if k in e} for e in entries if e]
+
+    return result
+
+
+def extract_pages(url: str, emit, page_size=100):
+
+    # yields the playlist as yt-dlp pages through it: emit(entries) is called from
+    # the extraction thread for every page and returning False stops the extraction.
+
+    ydl = get_ytdl()
+
+    info = ydl.extract_info(url, download=False, process=False)
+
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        info = ydl.process_ie_result(info, download=False)
+        emit([{k: info[k] for k in ENTRY_KEYS if k in info}])
+        return
+
+    page = []
+
+    for entry in info.get('entries') or []:
+
+        if not entry or entry.get('_type') == 'playlist':
+            continue
+
+        page.append({k: entry[k] for k in ENTRY_KEYS if k in entry})
+
+        if len(page) >= page_size:
+            if emit(page) is False:
+                return
+            page = []
+
+    if page:
+        emit(page)
+
+
+def extract(url: str):
+    try:
+        return compact(get_ytdl().extract_info(url, download=False))
+    except Exception as e:
+        if not in_worker:
+            raise
+        # yt-dlp exceptions do not always survive pickling back to the bot process
+        raise ExtractError(str(e)) from None
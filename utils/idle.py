@@ -0,0 +1,120 @@
+import asyncio
+import ctypes
+import heapq
+import itertools
+import os
+import time
+import traceback
+
+
+try:
+    # hands the memory of the reclaimed players back to the os (glibc only)
+    malloc_trim = ctypes.CDLL("libc.so.6").malloc_trim
+except (OSError, AttributeError):
+    malloc_trim = None
+
+
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+class IdleManager:
+
+    # every idle deadline of every player in one heap, served by a single task. cancelled or
+    # rescheduled entries stay in the heap and are skipped when they come up (the dict holds
+    # the live one), so schedule and cancel are O(log n) and O(1)
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}  # key -> (deadline, seq, callback)
+        self.counter = itertools.count()
+        self.task = None
+        self.wakeup = None
+        self.reclaimed = 0
+        self.freed = 0
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def start(self):
+        if self.task and not self.task.done():
+            return
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def schedule(self, key, delay, callback):
+
+        # callback: coroutine function, called (without arguments) once the deadline passes
+
+        self.start()
+
+        entry = (time.monotonic() + delay, next(self.counter), callback)
+        self.deadlines[key] = entry
+        heapq.heappush(self.heap, (entry[0], entry[1], key))
+
+        if self.heap[0][1] == entry[1]:
+            # earlier than what the task is sleeping for
+            self.wakeup.set()
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def pending(self, key):
+        return key in self.deadlines
+
+    def expired(self, now):
+
+        due = []
+
+        while self.heap and self.heap[0][0] <= now:
+            deadline, seq, key = heapq.heappop(self.heap)
+            if (entry := self.deadlines.get(key)) and entry[1] == seq:
+                del self.deadlines[key]
+                due.append(entry[2])
+
+        # don't let cancelled entries pile up in the heap
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(d, s, k) for k, (d, s, _) in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+        return due
+
+    async def run(self):
+
+        while True:
+
+            self.wakeup.clear()
+
+            timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if not (due := self.expired(time.monotonic())):
+                continue
+
+            before = rss()
+
+            for reclaimed in await asyncio.gather(*(callback() for callback in due), return_exceptions=True):
+                if isinstance(reclaimed, Exception):
+                    traceback.print_exception(type(reclaimed), reclaimed, reclaimed.__traceback__)
+                elif reclaimed is not False:
+                    self.reclaimed += 1
+
+            if malloc_trim:
+                malloc_trim(0)
+
+            # what the process gave back to the os
+            if before and (after := rss()):
+                self.freed += max(0, before - after)
+
+    def stats(self):
+        return {'pending': len(self.deadlines), 'heap': len(self.heap), 'reclaimed': self.reclaimed, 'freed_bytes': self.freed}
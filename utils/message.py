@@ -0,0 +1,81 @@
+import asyncio
+import time
+import traceback
+from collections import Counter
+
+import disnake
+
+
+# what every LiveMessage did, for /metrics
+stats = Counter()
+
+
+class LiveMessage:
+
+    # a single message of the player, edited in place. update() only stores the latest
+    # content and returns, a task of its own talks to discord: at most one request every
+    # `interval` seconds, updates made meanwhile are merged into the next one
+
+    def __init__(self, channel, interval=1.5, repost_after=120):
+        self.channel = channel
+        self.interval = interval
+        self.repost_after = repost_after
+        self.message = None
+        self.pending = None
+        self.task = None
+        self.last = 0.0
+        self.sent = 0.0
+
+    def update(self, **kwargs):
+
+        if self.pending is not None:
+            stats['coalesced'] += 1
+
+        self.pending = kwargs
+
+        if not self.task or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.flush())
+
+    def close(self):
+        self.pending = None
+        if self.task:
+            self.task.cancel()
+
+    def buried(self):
+        # other messages were sent below it a while ago, editing it wouldn't be seen
+        last = getattr(self.channel, 'last_message_id', None)
+        return last is not None and last != self.message.id and time.monotonic() - self.sent > self.repost_after
+
+    async def flush(self):
+
+        while self.pending is not None:
+
+            if (wait := self.last + self.interval - time.monotonic()) > 0:
+                await asyncio.sleep(wait)
+
+            kwargs, self.pending = self.pending, None
+            self.last = time.monotonic()
+
+            try:
+                if self.message and self.buried():
+                    message, self.message = self.message, None
+                    try:
+                        await message.delete()
+                    except disnake.HTTPException:
+                        pass
+
+                if self.message:
+                    try:
+                        await self.message.edit(**kwargs)
+                        stats['edited'] += 1
+                        continue
+                    except disnake.NotFound:
+                        # deleted by someone, send it again
+                        self.message = None
+
+                self.message = await self.channel.send(**kwargs)
+                self.sent = time.monotonic()
+                stats['sent'] += 1
+
+            except Exception:
+                traceback.print_exc()
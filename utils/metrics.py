@@ -0,0 +1,142 @@
+import os
+from bisect import bisect_left
+
+
+# prometheus text format, without the client library. observing a value is a bisect and
+# two additions, everything that can be read from the bot state is only computed when
+# /metrics is scraped.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+SIZE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+
+    # collect: function returning the values to build the histogram from at scrape time
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, collect=None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.collect = collect
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        # not locked: only ever called from the event loop
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self):
+
+        if self.collect:
+            counts, total = [0] * (len(self.buckets) + 1), 0.0
+            for value in self.collect():
+                counts[bisect_left(self.buckets, value)] += 1
+                total += value
+        else:
+            counts, total = self.counts, self.sum
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {format_value(total)}")
+        lines.append(f"{self.name}_count {cumulative}")
+
+        return lines
+
+
+class Gauge:
+
+    # collect: function returning the value, or a dict of {label value: value}
+
+    def __init__(self, name, help, collect=None, label=None):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.label = label
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+
+        value = self.collect() if self.collect else self.value
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+
+        if isinstance(value, dict):
+            lines.extend(f'{self.name}{{{self.label}="{k}"}} {format_value(v)}' for k, v in value.items())
+        elif value is not None:
+            lines.append(f"{self.name} {format_value(value)}")
+
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        # by name, so reloading a cog replaces its metrics instead of duplicating them
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} failed: {e!r}")
+        return "\n".join(lines) + "\n"
+
+
+def child_processes(name):
+
+    # children of this process with the given command name (linux only, None elsewhere)
+
+    pid = os.getpid()
+    count = 0
+
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return None
+
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children = f.read().split()
+        except OSError:
+            continue
+        for child in children:
+            try:
+                with open(f"/proc/{child}/comm") as f:
+                    if f.read().strip() == name:
+                        count += 1
+            except OSError:
+                pass
+
+    return count
+
+
+registry = Registry()
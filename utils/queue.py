@@ -0,0 +1,109 @@
+import json
+import sys
+import zlib
+from collections import deque
+from itertools import islice
+from random import shuffle
+
+from utils.cache import video_id
+
+
+class Track:
+
+    __slots__ = ('url', 'title', 'uploader', 'duration', 'requester_id')
+
+    def __init__(self, url, title, uploader, duration, requester_id=None):
+        self.url = url
+        self.title = title
+        # the same channels show up over and over in playlists
+        self.uploader = sys.intern(uploader) if uploader else uploader
+        self.duration = duration
+        self.requester_id = requester_id
+
+    @classmethod
+    def from_dict(cls, data: dict, requester_id=None):
+        return cls(data['url'], data['title'], data.get('uploader'), data['duration'], requester_id)
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return f"<Track {self.title!r} ({self.url})>"
+
+
+def pack_tracks(tracks):
+    # compact on-disk form for the player snapshots: one list per track (youtube videos by
+    # id), compressed
+    return zlib.compress(json.dumps(
+        [[video_id(t.url) or t.url, t.title, t.uploader, t.duration, t.requester_id] for t in tracks]
+    ).encode())
+
+
+def unpack_tracks(data):
+    return [
+        Track(url if "/" in url else f"https://www.youtube.com/watch?v={url}", *rest)
+        for url, *rest in json.loads(zlib.decompress(data))
+    ]
+
+
+class TrackQueue:
+
+    def __init__(self, tracks=()):
+        self.tracks = deque()
+        self.duration = 0
+        # bumped on every change, snapshots and views compare it instead of the tracks
+        self.version = 0
+        self.extend(tracks)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __bool__(self):
+        return bool(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(islice(self.tracks, *index.indices(len(self.tracks))))
+        return self.tracks[index]
+
+    def append(self, track: Track):
+        self.tracks.append(track)
+        self.duration += track.duration
+        self.version += 1
+
+    def extend(self, tracks):
+        for track in tracks:
+            self.tracks.append(track)
+            self.duration += track.duration
+        self.version += 1
+
+    def appendleft(self, track: Track):
+        self.tracks.appendleft(track)
+        self.duration += track.duration
+        self.version += 1
+
+    def popleft(self):
+        track = self.tracks.popleft()
+        self.duration -= track.duration
+        self.version += 1
+        return track
+
+    def remove(self, track: Track):
+        self.tracks.remove(track)
+        self.duration -= track.duration
+        self.version += 1
+
+    def clear(self):
+        self.tracks.clear()
+        self.duration = 0
+        self.version += 1
+
+    def shuffle(self):
+        # shuffling a deque in place costs O(n) per swap
+        tracks = list(self.tracks)
+        shuffle(tracks)
+        self.tracks = deque(tracks)
+        self.version += 1
@@ -0,0 +1,298 @@
+import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.tracing import tracer, NOOP
+
+
+# priorities, from the most to the least urgent
+PLAY = 0  # track that is about to play
+SEARCH = 1  # interactive /music play searches
+PREFETCH = 2  # lookahead of the next tracks, refused like searches when the queue is full
+PLAYLIST = 3  # background playlist resolution
+
+PRIORITIES = (PLAY, SEARCH, PREFETCH, PLAYLIST)
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+def pool_context():
+
+    # never fork the bot itself: by the time the pool starts it has voice, executor and
+    # tracing threads, and a lock held by one of them (sqlite, stdout, ytdl_lock) stays
+    # locked forever in the child. forkserver forks the workers from a clean process that
+    # only imported the main module (which doesn't start the bot outside of __main__), the
+    # extractor and yt-dlp. spawn starts them from scratch
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["__main__", "utils.extractor", "yt_dlp"])
+        return context
+
+    return multiprocessing.get_context("spawn")
+
+
+class ExtractionScheduler:
+
+    def __init__(self, workers=None, max_pending=None, max_pending_guild=None, max_running_guild=None, max_running_playlists=None, processes=None, initializer=None, recycle=None):
+        self.workers = workers or int(os.environ.get("EXTRACT_WORKERS", 4))
+        self.max_pending = max_pending or int(os.environ.get("EXTRACT_QUEUE_MAX", 100))
+        self.max_pending_guild = max_pending_guild or int(os.environ.get("EXTRACT_QUEUE_GUILD_MAX", 10))
+        # jobs of one guild running at the same time, and playlist walks (which hold their
+        # worker for minutes) running at the same time: the rest is left for PLAY/SEARCH
+        self.max_running_guild = max_running_guild or int(os.environ.get("EXTRACT_RUNNING_GUILD_MAX", max(1, self.workers // 2)))
+        self.max_running_playlists = max_running_playlists or int(os.environ.get("EXTRACT_RUNNING_PLAYLIST_MAX", max(1, self.workers - 1)))
+        if processes is None:
+            processes = os.environ.get("EXTRACT_MODE", "thread") == "process"
+        self.processes = processes
+        self.initializer = initializer
+        # process workers are replaced after this many jobs
+        self.recycle = recycle or int(os.environ.get("EXTRACT_RECYCLE", 250))
+        self.executor = None
+        self.thread_executor = None
+        self.executor_jobs = 0
+        self.restarts = 0
+        # one round-robin of guilds per priority: guild_id -> deque of jobs
+        self.queues = [OrderedDict() for _ in PRIORITIES]
+        self.pending = 0
+        self.pending_guild = {}
+        self.running = 0
+        self.running_guild = {}
+        self.running_priority = [0] * len(PRIORITIES)
+        self.has_work = None
+        self.tasks = []
+
+    def new_executor(self):
+        if self.processes:
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=pool_context(),
+                initializer=self.initializer,
+            )
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract")
+
+    def get_executor(self):
+
+        if self.processes and self.executor and self.executor_jobs >= self.recycle:
+            # running jobs finish on the old workers, new ones go to a fresh pool
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+        if not self.executor:
+            self.executor = self.new_executor()
+            self.executor_jobs = 0
+
+        self.executor_jobs += 1
+
+        return self.executor
+
+    async def warm_up(self, func):
+
+        # process mode: starts every worker now (running func once each) instead of on the
+        # first jobs. threads share the bot process' state, nothing to do for them
+        if not self.processes:
+            return
+
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+
+        await asyncio.gather(*(loop.run_in_executor(executor, func) for _ in range(self.workers)))
+
+    async def execute(self, func, args, threaded=False):
+
+        loop = asyncio.get_running_loop()
+
+        if threaded and self.processes:
+            # jobs that report back while they run (callbacks) can't leave the bot process
+            if not self.thread_executor:
+                self.thread_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract")
+            return await loop.run_in_executor(self.thread_executor, func, *args)
+
+        for retry in (False, True):
+
+            executor = self.get_executor()
+
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # a worker died (crash, oom kill...), only this pool is lost
+                if self.executor is executor:
+                    self.executor = None
+                    self.restarts += 1
+                if retry:
+                    raise
+
+    def start(self):
+        if self.tasks:
+            return
+        self.has_work = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self.worker()) for _ in range(self.workers)]
+
+    def shutdown(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks.clear()
+        for executor in (self.executor, self.thread_executor):
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = self.thread_executor = None
+
+    async def run(self, guild_id, func, *args, priority=SEARCH, threaded=False):
+
+        self.start()
+
+        # the track that is about to play is never refused, everything else fails fast
+        if priority != PLAY:
+            if self.pending >= self.max_pending:
+                raise SchedulerFull("extraction queue is full")
+            if self.pending_guild.get(guild_id, 0) >= self.max_pending_guild:
+                raise SchedulerFull("too many pending extractions for this guild")
+
+        future = asyncio.get_running_loop().create_future()
+
+        # time spent waiting for a worker, followed by the extraction itself
+        # with tracing off the command hooks still activate the no-op span, which is not a parent
+        parent = tracer.current() if tracer.enabled else None
+        span = tracer.span("extract.queue", parent=parent, priority=priority) if parent else None
+
+        job = (future, guild_id, func, args, threaded, parent, span)
+
+        self.queues[priority].setdefault(guild_id, deque()).append(job)
+        self.pending += 1
+        self.pending_guild[guild_id] = self.pending_guild.get(guild_id, 0) + 1
+        self.has_work.set()
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self.withdraw(priority, guild_id, job)
+            raise
+
+    def withdraw(self, priority, guild_id, job):
+
+        # a cancelled job that is still queued stops counting against the limits right away
+        queue = self.queues[priority]
+
+        if not (jobs := queue.get(guild_id)):
+            return
+
+        for n, queued in enumerate(jobs):
+            if queued is job:
+                del jobs[n]
+                break
+        else:
+            return
+
+        if not jobs:
+            del queue[guild_id]
+
+        self.dequeued(guild_id)
+
+        if (span := job[-1]):
+            span.finish(cancelled=1)
+
+    def dequeued(self, guild_id):
+
+        self.pending -= 1
+
+        if (count := self.pending_guild[guild_id] - 1):
+            self.pending_guild[guild_id] = count
+        else:
+            del self.pending_guild[guild_id]
+
+    def next_job(self):
+
+        for priority, queue in enumerate(self.queues):
+
+            if not queue:
+                continue
+
+            if priority == PLAYLIST and self.running_priority[PLAYLIST] >= self.max_running_playlists:
+                continue
+
+            # first guild in the round-robin that is still under its running limit. the
+            # track about to play is exempt, it must not wait for its own guild's playlists
+            for guild_id, jobs in queue.items():
+                if priority == PLAY or self.running_guild.get(guild_id, 0) < self.max_running_guild:
+                    break
+            else:
+                continue
+
+            job = jobs.popleft()
+
+            if jobs:
+                queue.move_to_end(guild_id)
+            else:
+                del queue[guild_id]
+
+            self.dequeued(guild_id)
+
+            self.running += 1
+            self.running_guild[guild_id] = self.running_guild.get(guild_id, 0) + 1
+            self.running_priority[priority] += 1
+
+            return priority, job
+
+    def job_done(self, priority, guild_id):
+
+        self.running -= 1
+        self.running_priority[priority] -= 1
+
+        if (count := self.running_guild[guild_id] - 1):
+            self.running_guild[guild_id] = count
+        else:
+            del self.running_guild[guild_id]
+
+        # jobs held back by the running limits can go now
+        if self.pending:
+            self.has_work.set()
+
+    async def worker(self):
+
+        while True:
+
+            if not (job := self.next_job()):
+                self.has_work.clear()
+                await self.has_work.wait()
+                continue
+
+            priority, (future, guild_id, func, args, threaded, parent, span) = job
+
+            if future.cancelled():
+                self.job_done(priority, guild_id)
+                continue
+
+            if span:
+                span.finish()
+                span = tracer.span("extract.run", parent=parent, func=getattr(func, '__name__', type(func).__name__))
+
+            try:
+                with span or NOOP:
+                    result = await self.execute(func, args, threaded)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.job_done(priority, guild_id)
+
+    def stats(self):
+        return {
+            'mode': 'process' if self.processes else 'thread',
+            'workers': self.workers,
+            'restarts': self.restarts,
+            'running': self.running,
+            'running_by_priority': list(self.running_priority),
+            'pending': self.pending,
+            'pending_by_priority': [sum(len(j) for j in q.values()) for q in self.queues],
+        }
@@ -0,0 +1,49 @@
+import asyncio
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self.calls = {}
+        self.waiters = {}
+        self.saved = 0
+
+    def __len__(self):
+        return len(self.calls)
+
+    def done(self, key, task):
+
+        if self.calls.get(key) is task:
+            del self.calls[key]
+            self.waiters.pop(key, None)
+
+        # every waiter may be gone already, don't let asyncio log the error as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key, coro_func, *args, **kwargs):
+
+        try:
+            task = self.calls[key]
+        except KeyError:
+            task = self.calls[key] = asyncio.ensure_future(coro_func(*args, **kwargs))
+            task.add_done_callback(lambda t: self.done(key, t))
+        else:
+            self.saved += 1
+
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+
+        # a cancelled caller must not cancel the call the other callers are waiting on, but
+        # once the last one is gone nobody needs it anymore (a stale prefetch): the call is
+        # cancelled too, which withdraws its job from the scheduler.
+        # errors are not remembered: the key is released and the next call tries again
+        try:
+            return await asyncio.shield(task)
+        finally:
+            # a finished call was already released by done()
+            if self.calls.get(key) is task:
+                if (count := self.waiters[key] - 1):
+                    self.waiters[key] = count
+                else:
+                    del self.waiters[key]
+                    task.cancel()
@@ -0,0 +1,21 @@
+import time
+
+from utils.metrics import registry
+
+# imported first thing by main.py, phases are measured from here
+STARTED = time.perf_counter()
+
+phases = {}
+
+
+def mark(phase):
+
+    # only the first time: reconnects fire on_connect / on_ready again
+    if phase in phases:
+        return
+
+    phases[phase] = time.perf_counter() - STARTED
+    print(f"startup: {phase} em {phases[phase]:.2f}s")
+
+
+registry.gauge("minji_startup_seconds", "seconds from process start to each startup phase", lambda: dict(phases), label="phase")
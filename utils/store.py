@@ -0,0 +1,224 @@
+import os
+import sqlite3
+import threading
+import time
+
+from utils.cache import video_id
+
+
+# only searches and video metadata are kept on disk: stream urls expire within hours
+# and always come from a fresh extraction (or the in-memory ExtractCache).
+# the players table holds the player snapshots used to resume playback after a restart
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    query TEXT PRIMARY KEY,
+    video_ids TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS videos (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    uploader TEXT,
+    duration INTEGER NOT NULL,
+    thumbnail TEXT,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS players (
+    guild_id INTEGER PRIMARY KEY,
+    voice_channel_id INTEGER NOT NULL,
+    text_channel_id INTEGER NOT NULL,
+    settings TEXT NOT NULL,
+    current BLOB,
+    position REAL NOT NULL,
+    queue BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS videos_used ON videos (used);
+CREATE INDEX IF NOT EXISTS searches_created ON searches (created);
+"""
+
+
+class ExtractStore:
+
+    def __init__(self, path=None, search_ttl=3 * 86400, video_ttl=30 * 86400, max_searches=None, max_videos=None, batch_size=200):
+        self.path = path or os.environ.get("CACHE_DB", "cache.sqlite3")
+        self.search_ttl = search_ttl
+        self.video_ttl = video_ttl
+        self.max_searches = max_searches or int(os.environ.get("CACHE_DB_MAX_SEARCHES", 50000))
+        self.max_videos = max_videos or int(os.environ.get("CACHE_DB_MAX_VIDEOS", 200000))
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.pending_searches = {}
+        self.pending_videos = {}
+        self.pending_used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get_tracks(self, query: str):
+
+        now = time.time()
+
+        with self.lock:
+
+            if (pending := self.pending_searches.get(query)):
+                ids = pending
+            else:
+                row = self.db.execute("SELECT video_ids, created FROM searches WHERE query = ?", (query,)).fetchone()
+                if not row or row[1] + self.search_ttl < now:
+                    self.misses += 1
+                    return None
+                ids = row[0].split(",") if row[0] else []
+
+            videos = {}
+
+            for n in range(0, len(ids), 500):
+                chunk = ids[n:n + 500]
+                rows = self.db.execute(
+                    f"SELECT id, title, uploader, duration, created FROM videos WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for vid, title, uploader, duration, created in rows:
+                    if created + self.video_ttl >= now:
+                        videos[vid] = (title, uploader, duration)
+
+            for vid in ids:
+                if vid not in videos and (pending := self.pending_videos.get(vid)):
+                    videos[vid] = pending[:3]
+
+            if len(videos) < len(ids):
+                self.misses += 1
+                return None
+
+            self.pending_used.update(ids)
+            self.hits += 1
+
+        return [
+            {
+                'url': f"https://www.youtube.com/watch?v={vid}",
+                'title': videos[vid][0],
+                'uploader': videos[vid][1],
+                'duration': videos[vid][2],
+            } for vid in ids
+        ]
+
+    def put_tracks(self, query: str, tracks: list):
+
+        ids = []
+
+        for t in tracks:
+            if not (vid := video_id(t['url'])):
+                # not a youtube video, nothing to key it by
+                return
+            ids.append(vid)
+            self.put_video(vid, t['title'], t.get('uploader'), t['duration'])
+
+        with self.lock:
+            self.pending_searches[query] = ids
+
+        self.maybe_flush()
+
+    def put_info(self, info: dict):
+        if (vid := info.get('id')) and info.get('duration') and info.get('title'):
+            self.put_video(vid, info['title'], info.get('uploader'), info['duration'], info.get('thumbnail'))
+            self.maybe_flush()
+
+    def put_video(self, vid, title, uploader, duration, thumbnail=None):
+        with self.lock:
+            self.pending_videos[vid] = (title, uploader, int(duration), thumbnail)
+
+    def pending(self):
+        return len(self.pending_searches) + len(self.pending_videos) + len(self.pending_used)
+
+    def maybe_flush(self):
+        if self.pending() >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+
+        # one transaction for everything written since the last flush
+
+        with self.lock:
+
+            if not self.pending():
+                return
+
+            searches, self.pending_searches = self.pending_searches, {}
+            videos, self.pending_videos = self.pending_videos, {}
+            used, self.pending_used = self.pending_used, set()
+
+            now = time.time()
+
+            with self.db:
+                self.db.execute("BEGIN")
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO searches (query, video_ids, created) VALUES (?, ?, ?)",
+                    [(q, ",".join(ids), now) for q, ids in searches.items()]
+                )
+                self.db.executemany(
+                    "INSERT INTO videos (id, title, uploader, duration, thumbnail, created, used) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET title = excluded.title, uploader = COALESCE(excluded.uploader, videos.uploader), "
+                    "duration = excluded.duration, thumbnail = COALESCE(excluded.thumbnail, videos.thumbnail), "
+                    "created = excluded.created, used = excluded.used",
+                    [(vid, *v, now, now) for vid, v in videos.items()]
+                )
+                self.db.executemany("UPDATE videos SET used = ? WHERE id = ?", [(now, vid) for vid in used])
+
+            self.evict(now)
+
+    def evict(self, now):
+
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.execute("DELETE FROM searches WHERE created < ?", (now - self.search_ttl,))
+            self.db.execute("DELETE FROM videos WHERE created < ?", (now - self.video_ttl,))
+            # size bound: the least recently used rows go first
+            self.db.execute(
+                "DELETE FROM searches WHERE query IN (SELECT query FROM searches ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_searches,)
+            )
+            self.db.execute(
+                "DELETE FROM videos WHERE id IN (SELECT id FROM videos ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_videos,)
+            )
+
+    def save_players(self, players, positions, deleted):
+
+        # players: full rows of the players whose queue or settings changed, positions:
+        # (position, guild_id) of the ones where only the playback moved on
+
+        now = time.time()
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO players (guild_id, voice_channel_id, text_channel_id, settings, current, position, queue, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*row, now) for row in players]
+            )
+            self.db.executemany("UPDATE players SET position = ?, updated = ? WHERE guild_id = ?", [(p, now, g) for p, g in positions])
+            self.db.executemany("DELETE FROM players WHERE guild_id = ?", [(g,) for g in deleted])
+
+    def load_players(self, max_age=6 * 3600):
+        with self.lock:
+            self.db.execute("DELETE FROM players WHERE updated < ?", (time.time() - max_age,))
+            return self.db.execute(
+                "SELECT guild_id, voice_channel_id, text_channel_id, settings, current, position, queue FROM players"
+            ).fetchall()
+
+    def delete_player(self, guild_id):
+        with self.lock:
+            self.db.execute("DELETE FROM players WHERE guild_id = ?", (guild_id,))
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'pending': self.pending()}
@@ -0,0 +1,201 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+
+# spans for the play pipeline. TRACE_FILE writes one json object per span, OTLP_ENDPOINT
+# posts them to an OTLP/HTTP collector (jaeger, otel-collector...). with neither set every
+# span is the same no-op object and nothing is recorded.
+
+current = contextvars.ContextVar("span", default=None)
+
+MISSING = object()
+
+
+class Span:
+
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'start', 'end', 'attrs', 'token')
+
+    def __init__(self, tracer, name, trace_id, parent_id, attrs, start=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = start or time.time_ns()
+        self.end = None
+        self.attrs = attrs
+        self.token = None
+
+    def __enter__(self):
+        self.token = current.set(self)
+        return self
+
+    def __exit__(self, etype, e, tb):
+        current.reset(self.token)
+        if e:
+            self.attrs['error'] = repr(e)
+        self.finish()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, **attrs):
+        # thread safe, the first packet span is finished by the voice thread
+        if self.end is None:
+            self.attrs.update(attrs)
+            self.end = time.time_ns()
+            self.tracer.export(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start / 1e9,
+            'duration_ms': (self.end - self.start) / 1e6,
+            **self.attrs,
+        }
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [
+                {'key': k, 'value': {'intValue': str(v)} if isinstance(v, int) else {'stringValue': str(v)}}
+                for k, v in self.attrs.items()
+            ],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class NoopSpan:
+
+    trace_id = None
+    attrs = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, e, tb):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+    def finish(self, **attrs):
+        pass
+
+
+NOOP = NoopSpan()
+
+
+class Tracer:
+
+    def __init__(self, path=None, endpoint=None, service="minji-music"):
+        self.path = path or os.environ.get("TRACE_FILE")
+        self.endpoint = endpoint or os.environ.get("OTLP_ENDPOINT")
+        self.service = service
+        self.enabled = bool(self.path or self.endpoint)
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.thread = None
+
+    def span(self, name, parent=MISSING, **attrs):
+
+        # parent: the active span by default, None starts a new trace. the guild id of the
+        # trace root is copied to every span so they can be grouped per guild
+
+        if not self.enabled:
+            return NOOP
+
+        if parent is MISSING:
+            parent = current.get()
+
+        if parent is None or parent is NOOP:
+            return Span(self, name, os.urandom(16).hex(), None, attrs)
+
+        if 'guild_id' in parent.attrs and 'guild_id' not in attrs:
+            attrs['guild_id'] = parent.attrs['guild_id']
+
+        return Span(self, name, parent.trace_id, parent.span_id, attrs)
+
+    @contextmanager
+    def use(self, span):
+        # makes `span` the parent of the spans inside, without finishing it
+        token = current.set(span)
+        try:
+            yield span
+        finally:
+            current.reset(token)
+
+    def activate(self, span):
+        # for spans started and finished in separate callbacks (the command hooks), the
+        # span stays active until the task ends
+        current.set(span)
+        return span
+
+    def current(self):
+        return current.get()
+
+    def export(self, span):
+
+        with self.lock:
+            if len(self.buffer) >= 10000:
+                # the exporter can't keep up, don't grow without bound
+                self.dropped += 1
+                return
+            self.buffer.append(span)
+
+            if not self.thread:
+                self.thread = threading.Thread(target=self.run, name="tracing", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(2)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"tracing: {e!r}")
+
+    def flush(self):
+
+        with self.lock:
+            spans, self.buffer = self.buffer, []
+
+        if not spans:
+            return
+
+        if self.path:
+            with open(self.path, "a") as f:
+                f.writelines(json.dumps(span.to_dict()) + "\n" for span in spans)
+
+        if self.endpoint:
+            body = {
+                'resourceSpans': [{
+                    'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service}}]},
+                    'scopeSpans': [{'scope': {'name': 'minji'}, 'spans': [span.to_otlp() for span in spans]}],
+                }]
+            }
+            request = urllib.request.Request(
+                self.endpoint.rstrip("/") + "/v1/traces",
+                data=json.dumps(body).encode(),
+                headers={'Content-Type': 'application/json'},
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+
+
+tracer = Tracer()
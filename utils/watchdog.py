@@ -0,0 +1,162 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold(frame, root):
+    # root first, the way flamegraph.pl / speedscope read folded stacks
+    names = []
+    while frame:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names))
+
+
+class LoopWatchdog:
+
+    # a task on the loop updates a heartbeat, a thread outside of it notices when the
+    # heartbeat stops and prints what the loop thread is stuck on
+
+    def __init__(self, loop, threshold=None, interval=0.1):
+        self.loop = loop
+        self.threshold = threshold or int(os.environ.get("WATCHDOG_THRESHOLD_MS", 250)) / 1000
+        self.interval = interval
+        self.beat = time.perf_counter()
+        self.loop_thread = None
+        self.task = None
+        self.stopped = threading.Event()
+        self.stalls = 0
+        self.worst = 0.0
+
+    def start(self):
+        self.task = self.loop.create_task(self.heartbeat())
+        threading.Thread(target=self.watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+
+    async def heartbeat(self):
+        self.beat = time.perf_counter()
+        self.loop_thread = threading.get_ident()
+        while True:
+            self.beat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+
+    def watch(self):
+
+        reported = None
+
+        while not self.stopped.wait(self.interval):
+
+            # the loop isn't running yet (cogs loading, login): nothing to measure
+            if self.loop_thread is None:
+                continue
+
+            beat = self.beat
+            blocked = time.perf_counter() - beat - self.interval
+
+            if blocked < self.threshold:
+                continue
+
+            self.worst = max(self.worst, blocked)
+
+            if reported == beat:
+                continue
+
+            # once per stall, while it is still going on
+            reported = beat
+            self.stalls += 1
+
+            if not (frame := sys._current_frames().get(self.loop_thread)):
+                continue
+
+            try:
+                task = asyncio.current_task(self.loop)
+            except RuntimeError:
+                task = None
+
+            print(
+                f"event loop bloqueado há {blocked * 1000:.0f}ms"
+                + (f" na task {task.get_name()} ({task.get_coro()!r})" if task else "")
+                + ":\n" + "".join(traceback.format_stack(frame)),
+                file=sys.stderr
+            )
+
+    def stats(self):
+        return {'threshold': self.threshold, 'stalls': self.stalls, 'worst': self.worst}
+
+
+class SamplingProfiler:
+
+    # wall clock sampling of python stacks, written as folded stacks (one "a;b;c count" line
+    # per distinct stack) for flamegraph.pl, inferno or speedscope
+
+    def __init__(self, interval=0.005, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.samples = Counter()
+        self.count = 0
+
+    def run(self, seconds):
+
+        # blocking, meant for its own thread
+        me = threading.get_ident()
+        names = {}
+        end = time.perf_counter() + seconds
+
+        while time.perf_counter() < end:
+
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (self.thread_ids and ident not in self.thread_ids):
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                self.samples[fold(frame, names.get(ident, str(ident)))] += 1
+
+            self.count += 1
+            time.sleep(self.interval)
+
+        return self
+
+    def folded(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+    def save(self, directory=None):
+        directory = directory or os.environ.get("PROFILE_DIR", "profiles")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
+
+
+async def profile(seconds, all_threads=False):
+
+    # samples the calling loop (or every thread) from a thread of its own, the default
+    # executor may be the thing that is backed up
+    loop = asyncio.get_running_loop()
+    profiler = SamplingProfiler(thread_ids=None if all_threads else {threading.get_ident()})
+    done = loop.create_future()
+
+    def run():
+        try:
+            profiler.run(seconds)
+        finally:
+            loop.call_soon_threadsafe(done.set_result, None)
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+    await done
+
+    return profiler